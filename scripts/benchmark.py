@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks against synthetic event lanes, for seeing how the build scales past our (small) real templates.
+
+    python scripts/benchmark.py run --lanes 8 --events 2000 --output bench_results.json
+    python scripts/benchmark.py run --compare bench_results.json
+"""
+
+import datetime
+import json
+import os
+import pathlib
+import pickle
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+import click
+import yaml
+
+import columnar
+from definitions import EventLane, ScheduleSnapshot
+from formats.all import OUTPUT_FORMATS, SHARED_INPUTS, OutputFormat
+from formats.timezones import localize
+from formats.webhook import day_title, event_block
+from ingestion import (
+    EVENTS_SCHEMA_PATH,
+    META_SCHEMA_PATH,
+    BaseSafeLoader,
+    IngestedLane,
+    LaneCache,
+    PureSafeLineLoader,
+    SafeLineLoader,
+    TemplateSchemas,
+    ingest_lanes,
+)
+from occurrences import OccurrenceIndex
+from output import OutputWriter
+from pipeline import Pipeline
+from publisher import WebhookPublisher
+from webhook_stub import running_stub
+
+
+SYNTHETIC_TIMEZONES = [
+    "America/Los_Angeles",
+    "America/Chicago",
+    "America/New_York",
+    "Europe/London",
+    "Europe/Paris",
+    "Europe/Berlin",
+    "Asia/Tokyo",
+    "Asia/Seoul",
+    "Australia/Brisbane",
+    "Australia/Sydney",
+]
+
+SYNTHETIC_TAGS = [
+    "event:class",
+    "event:sign_zone",
+    "platform:vrchat",
+    "platform:discord",
+    "vr:pc",
+    "vr:quest",
+    "audience:beginners",
+]
+
+
+def generate_lanes(folder: pathlib.Path, lanes: int, events: int, seed: int = 0, global_lane: bool = True) -> list[pathlib.Path]:
+    """
+    Writes `lanes` template folders with `events` events each into `folder`, returning the lane folders.
+
+    Events get a mix of timezones, intervals, not_before/not_after bounds and paused flags, roughly in the
+    proportions seen in the real templates. Like the real templates, there's also an empty lane that uses all events.
+    """
+
+    generator = random.Random(seed)
+    lane_folders = []
+
+    for lane_index in range(lanes):
+        lane_folder = folder / f"synthetic_{lane_index:03d}"
+        lane_folder.mkdir(parents=True, exist_ok=True)
+        default_timezone = generator.choice(SYNTHETIC_TIMEZONES)
+
+        meta = {
+            "channels": {"schedule": 771111584574603284 + lane_index, "events": 610999109910003722 + lane_index},
+            "default_timezone": default_timezone,
+            "language_info": {
+                "abbreviation": f"S{lane_index:02d}",
+                "native_localization": "en",
+                "localized_name": {"en": f"Synthetic Sign Language {lane_index}"},
+            },
+            "webhook": {
+                "channel": "schedule",
+                "url": f"SYNTHETIC_{lane_index}_WEBHOOK_URL",
+                "message_id": f"SYNTHETIC_{lane_index}_MESSAGE_ID",
+            },
+        }
+
+        raw_events = []
+
+        for event_index in range(events):
+            basis = datetime.date(2024, 1, 1) + datetime.timedelta(days=generator.randrange(0, 900))
+            schedule: dict[str, typing.Any] = {
+                "basis": basis.isoformat(),
+                "day": basis.strftime("%A"),
+                "hour": generator.randrange(0, 24),
+                "minute": generator.choice([0, 0, 0, 15, 30, 30, 45]),
+            }
+
+            if generator.random() < 0.4:
+                schedule["timezone"] = generator.choice(SYNTHETIC_TIMEZONES)
+            if generator.random() < 0.3:
+                schedule["interval"] = generator.choice([1, 14, 21, 28])
+            if generator.random() < 0.15:
+                schedule["not_before"] = (basis + datetime.timedelta(days=generator.randrange(0, 400))).isoformat()
+            if generator.random() < 0.15:
+                schedule["not_after"] = (basis + datetime.timedelta(days=generator.randrange(0, 1200))).isoformat()
+
+            raw_event: dict[str, typing.Any] = {
+                "host": f"host_{generator.randrange(0, max(2, events // 3)):05d}",
+                "name": f"Synthetic Event {event_index}",
+                "tags": generator.sample(SYNTHETIC_TAGS, k=generator.randrange(1, 4)),
+                "schedule": schedule,
+            }
+
+            if generator.random() < 0.05:
+                raw_event["paused"] = True
+
+            raw_events.append(raw_event)
+
+        (lane_folder / 'meta.yaml').write_text(yaml.safe_dump(meta, sort_keys=False), encoding='utf-8')
+        (lane_folder / 'events.yaml').write_text(yaml.safe_dump({"events": raw_events}, sort_keys=False), encoding='utf-8')
+        lane_folders.append(lane_folder)
+
+    if global_lane:
+        lane_folder = folder / "synthetic_global"
+        lane_folder.mkdir(parents=True, exist_ok=True)
+
+        meta = {
+            "channels": {"schedule": 771111584574603284},
+            "default_timezone": "America/New_York",
+            "use_all_events": True,
+            "webhook": {"channel": "schedule", "url": "SYNTHETIC_GLOBAL_WEBHOOK_URL", "header": "# Global Schedule"},
+        }
+
+        (lane_folder / 'meta.yaml').write_text(yaml.safe_dump(meta, sort_keys=False), encoding='utf-8')
+        (lane_folder / 'events.yaml').write_text(yaml.safe_dump({"events": []}), encoding='utf-8')
+        lane_folders.append(lane_folder)
+
+    return lane_folders
+
+
+class ChangedOutputWriter(OutputWriter):
+    """
+    Writes (and compresses) every output as if it had changed, so repeated runs keep timing what a build that changed
+    everything does, rather than the skip for unchanged content.
+    """
+
+    def previous_hash(self, name: str) -> str | None:
+        return None
+
+
+def retained_bytes(callback: typing.Callable[[], typing.Any]) -> int:
+    # What the callback's result keeps allocated, which it's held onto for until it's measured
+    tracemalloc.start()
+
+    try:
+        result = callback()
+        size, _peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return size
+
+
+def timed(callback: typing.Callable[[], typing.Any], repeat: int, setup: typing.Callable[[], typing.Any] | None = None) -> float:
+    # Best of N, as anything slower than the fastest run is noise from elsewhere on the machine
+    best = float('inf')
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        callback()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def clear_caches():
+    # A real build starts with cold caches, so each timed run should too
+    localize.cache_clear()
+    event_block.cache_clear()
+    day_title.cache_clear()
+
+
+class BenchmarkResults:
+    def __init__(self, parameters: dict[str, typing.Any]):
+        self.parameters = parameters
+        self.results: dict[str, dict[str, typing.Any]] = {}
+        self.memory: dict[str, dict[str, typing.Any]] = {}
+
+    def record(self, name: str, seconds: float, items: int | None = None, baseline: str | None = None):
+        self.results[name] = {"seconds": seconds, "items": items}
+
+        if items:
+            self.results[name]["microseconds_per_item"] = seconds * 1_000_000 / items
+
+        comparison = f" ({self.results[baseline]['seconds'] / seconds:.2f}x vs {baseline})" if baseline else ""
+        click.echo(f"  {name:<44} {seconds * 1000:10.1f} ms{comparison}")
+
+    def record_memory(self, name: str, size: int, items: int | None = None):
+        # Kept apart from the timings, which are what --compare checks
+        self.memory[name] = {"bytes": size, "items": items}
+
+        if items:
+            self.memory[name]["bytes_per_item"] = size / items
+
+        click.echo(f"  {name:<44} {size / 1024 / 1024:10.1f} MiB" + (f" ({size / items:.0f} B/item)" if items else ""))
+
+    def to_json(self) -> dict[str, typing.Any]:
+        return {
+            "created": datetime.datetime.now(datetime.UTC).isoformat(),
+            "environment": {
+                "python": sys.version.split()[0],
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "libyaml": BaseSafeLoader is not yaml.SafeLoader,
+            },
+            "parameters": self.parameters,
+            "results": self.results,
+            "memory": self.memory,
+        }
+
+
+def compare_results(previous: dict[str, typing.Any], current: dict[str, typing.Any], tolerance: float) -> list[str]:
+    regressions = []
+
+    click.secho(f"Compared with {previous.get('created', 'previous run')}:", fg='blue')
+
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name, None)
+
+        if before is None:
+            continue
+
+        change = result["seconds"] / before["seconds"] - 1 if before["seconds"] else 0.0
+        regressed = change > tolerance
+        click.secho(f"  {name:<44} {change:+9.1%}", fg='red' if regressed else ('green' if change < -tolerance else None))
+
+        if regressed:
+            regressions.append(name)
+
+    return regressions
+
+
+def synthetic_event_lanes(ingested_lanes: list[IngestedLane], webhooks: bool) -> list[EventLane]:
+    return [
+        EventLane(
+            name=lane.name,
+            meta=lane.meta,
+            events=lane.events,
+            # Shaped like a real webhook URL, the publisher's base URL sends it to the stand-in server
+            webhook_url=f"https://discord.com/api/webhooks/{100000000000000000 + index}/{'t' * 68}" if webhooks else None,
+            webhook_info=lane.meta.get('webhook', None),
+            webhook_message_id=200000000000000000 + index,
+        )
+        for index, lane in enumerate(ingested_lanes)
+    ]
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--lanes', default=8, show_default=True)
+@click.option('--events', default=2000, show_default=True, help="Events per lane.")
+@click.option('--repeat', default=3, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@click.option('--jobs', type=int, default=None, help="Worker processes for parallel ingestion.")
+@click.option('--webhook-latency', default=0.05, show_default=True, help="Seconds the stand-in webhook server takes per request.")
+@click.option(
+    '--output', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=pathlib.Path('bench_results.json'),
+    show_default=True, help="Where to write the machine-readable results.",
+)
+@click.option(
+    '--compare', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path), default=None,
+    help="A previous results file to check for regressions against.",
+)
+@click.option('--tolerance', default=0.2, show_default=True, help="Slowdown (as a fraction) counted as a regression.")
+def run(
+    lanes: int,
+    events: int,
+    repeat: int,
+    seed: int,
+    jobs: int | None,
+    webhook_latency: float,
+    output: pathlib.Path,
+    compare: pathlib.Path | None,
+    tolerance: float,
+):
+    """
+    Times every stage of the build against synthetic lanes.
+    """
+
+    results = BenchmarkResults({
+        "lanes": lanes, "events": events, "repeat": repeat, "seed": seed, "jobs": jobs, "webhook_latency": webhook_latency,
+    })
+
+    with open(META_SCHEMA_PATH, 'r', encoding='utf-8') as fp:
+        meta_schema = json.load(fp)
+
+    with open(EVENTS_SCHEMA_PATH, 'r', encoding='utf-8') as fp:
+        events_schema = json.load(fp)
+
+    with tempfile.TemporaryDirectory() as directory:
+        lane_folders = generate_lanes(pathlib.Path(directory), lanes, events, seed)
+        contents = [(lane_folder / 'events.yaml').read_bytes() for lane_folder in lane_folders]
+        total_events = lanes * events
+
+        click.secho(f"{lanes} lanes x {events} events ({sum(map(len, contents)) / 1024:.0f} KiB of events.yaml)", fg='blue')
+
+        click.secho("Ingestion", fg='blue')
+
+        results.record("yaml.pure_python", timed(
+            lambda: [yaml.load(content, Loader=PureSafeLineLoader) for content in contents], repeat
+        ), total_events)
+        results.record("yaml.line_loader", timed(
+            lambda: [yaml.load(content, Loader=SafeLineLoader) for content in contents], repeat
+        ), total_events, baseline="yaml.pure_python")
+
+        template_schemas = TemplateSchemas(meta_schema, events_schema)
+        parsed = [
+            (lane_folder.name, yaml.load((lane_folder / 'meta.yaml').read_bytes(), Loader=SafeLineLoader), yaml.load(content, Loader=SafeLineLoader))
+            for lane_folder, content in zip(lane_folders, contents)
+        ]
+
+        results.record("schema.compile", timed(lambda: TemplateSchemas(meta_schema, events_schema), repeat))
+        results.record("schema.validate_and_convert", timed(
+            lambda: [template_schemas.decode_events(name, meta, events_data) for name, meta, events_data in parsed], repeat
+        ), total_events)
+
+        lane_cache = LaneCache(enabled=False)
+
+        def ingest(jobs: int | None) -> list[IngestedLane]:
+            ingested = []
+
+            for _event_lane_name, lane, exception in ingest_lanes(lane_folders, meta_schema, events_schema, lane_cache, jobs):
+                if exception is not None:
+                    raise exception
+
+                ingested.append(lane)
+
+            return ingested
+
+        results.record("ingestion.serial", timed(lambda: ingest(1), repeat), total_events)
+        results.record("ingestion.parallel", timed(lambda: ingest(jobs), repeat), total_events, baseline="ingestion.serial")
+
+        ingested_lanes = ingest(1)
+
+    event_lanes = synthetic_event_lanes(ingested_lanes, webhooks=True)
+    now = datetime.datetime.now(datetime.UTC)
+    all_events = [event for event_lane in event_lanes for event in event_lane.events]
+
+    click.secho("Memory", fg='blue')
+
+    # A copy of every event (strings, datetimes and all), as a lane loaded from the cache would be
+    results.record_memory("memory.events", retained_bytes(lambda: pickle.loads(pickle.dumps(all_events))), total_events)
+
+    if columnar.available():
+        results.record_memory("memory.columnar", retained_bytes(
+            lambda: [columnar.ColumnarEvents(event_lane.events) for event_lane in event_lanes]
+        ), total_events)
+
+    click.secho("Occurrences", fg='blue')
+
+    results.record("occurrences.next_occurrence_after", timed(
+        lambda: [event.next_occurrence_after(now) for event in all_events], repeat
+    ), total_events)
+
+    if columnar.available():
+        results.record("occurrences.columnar", timed(
+            lambda: [columnar.ColumnarEvents(event_lane.events).next_occurrences(now) for event_lane in event_lanes], repeat
+        ), total_events, baseline="occurrences.next_occurrence_after")
+
+    results.record("occurrences.snapshot", timed(lambda: ScheduleSnapshot.build(event_lanes, now), repeat), total_events)
+
+    snapshot = ScheduleSnapshot.build(event_lanes, now)
+
+    results.record("occurrences.index", timed(lambda: OccurrenceIndex.build(snapshot), repeat), total_events)
+
+    occurrence_index = OccurrenceIndex.build(snapshot)
+    week_start = now - datetime.timedelta(days=now.weekday())
+
+    results.record("occurrences.week_query", timed(
+        lambda: [list(occurrence_index.between(week_start, week_start + datetime.timedelta(days=7), [event_lane.name])) for event_lane in event_lanes],
+        repeat,
+    ), total_events)
+    results.record("occurrences.next_25", timed(lambda: occurrence_index.next(25, now), repeat))
+
+    click.secho("Output formats", fg='blue')
+
+    with running_stub(latency=webhook_latency) as (stub_url, _stub_stats), tempfile.TemporaryDirectory() as directory:
+        # Every run writes (and compresses) every output, as a build where everything changed would
+        output_writer = ChangedOutputWriter(pathlib.Path(directory))
+        pipeline = Pipeline({
+            "event_lanes": event_lanes,
+            "snapshot": snapshot,
+            "webhook_publisher": WebhookPublisher(base_url=stub_url),
+            "previous_webhooks": {},
+            "output_writer": output_writer,
+        }, SHARED_INPUTS)
+
+        def write_output(output_format: OutputFormat, output: typing.Any):
+            # Formats that stream have already written their files, so the others are timed writing theirs too
+            if not output_format.streams:
+                output_writer.write(
+                    output_format.target_filename, output if isinstance(output, str) else json.dumps(output, indent=2),
+                )
+
+        for output_format in OUTPUT_FORMATS:
+            results.record(
+                f"format.{output_format.target_filename}",
+                timed(lambda: write_output(output_format, pipeline.call(output_format)), repeat, setup=clear_caches),
+                total_events,
+            )
+
+        def run_all():
+            for output_format, output, exception, _elapsed in pipeline.run(OUTPUT_FORMATS):
+                if exception is not None:
+                    raise exception
+
+                write_output(output_format, output)
+
+        results.record("format.all_concurrently", timed(run_all, repeat, setup=clear_caches), total_events)
+
+    current = results.to_json()
+
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(current, fp, indent=2)
+
+    click.secho(f"Results written to {output}", fg='blue')
+
+    if compare is not None:
+        with open(compare, 'r', encoding='utf-8') as fp:
+            regressions = compare_results(json.load(fp), current, tolerance)
+
+        if regressions:
+            raise click.ClickException(f"{len(regressions)} benchmark(s) regressed by more than {tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
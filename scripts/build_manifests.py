@@ -4,170 +4,150 @@
 Manifest build script.
 """
 
-import contextlib
+import cProfile
 import datetime
-import json
-import os
 import pathlib
-from zoneinfo import ZoneInfo
+import pstats
 
 import click
-import discord
-import jsonschema
-from yaml import load
 
-from yaml import SafeLoader, MappingNode
+import reporting
+from builder import OUTPUT_FOLDER, build, find_lane_folders
+from conflicts import DEFAULT_HORIZON
+from formats.all import OUTPUT_FORMATS, select_formats
+from reporting import BuildReporter
 
-from definitions import EventLane, EventLaneEvent, EventLaneMeta, EventLaneRawEvents
-from formats.all import OUTPUT_FORMATS
-
-
-SCRIPTS_FOLDER = pathlib.Path(__file__).parent
-SCHEMA_FOLDER = SCRIPTS_FOLDER.parent / 'schema'
-TEMPLATES_FOLDER = SCRIPTS_FOLDER.parent / 'templates'
-OUTPUT_FOLDER = SCRIPTS_FOLDER.parent / 'output'
-
-
-class SafeLineLoader(SafeLoader):
-    def construct_mapping(self, node: MappingNode, deep: bool = False):
-        mapping = super(SafeLineLoader, self).construct_mapping(node, deep=deep)
-        mapping['__line__'] = node.start_mark.line + 1
-        return mapping
 
+@click.command()
+@click.option(
+    '--webhook-base-url', envvar='WEBHOOK_BASE_URL', default=None,
+    help="Send webhook requests to this server instead (e.g. a local webhook_stub.py) for testing.",
+)
+@click.option('--webhook-concurrency', default=4, show_default=True, help="Maximum webhook requests in flight at once.")
+@click.option(
+    '--webhook-state', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=OUTPUT_FOLDER / 'webhook.json',
+    help="Previous webhook.json, used to skip editing messages whose content hasn't changed.",
+)
+@click.option('--force-webhooks', is_flag=True, help="Edit every webhook message even if its content hasn't changed.")
+@click.option('--no-cache', is_flag=True, help="Re-parse and re-validate every lane, ignoring the parsed lane cache.")
+@click.option('--jobs', type=int, default=None, help="Worker processes for parsing large lanes. Defaults to the CPU count.")
+@click.option(
+    '--format', 'format_patterns', multiple=True, metavar='PATTERN',
+    help="Only build the formats whose filename matches (e.g. index.html or 'textmeshpro.*'). Can be repeated.",
+)
+@click.option(
+    '--lane', 'lane_names', multiple=True, metavar='NAME',
+    help="Only build from this event lane. Can be repeated. Webhooks are skipped, as they need every lane.",
+)
+@click.option(
+    '--conflict-horizon', type=click.IntRange(min=0), default=DEFAULT_HORIZON.days, show_default=True, metavar='DAYS',
+    help="Warn about events that overlap (in a lane, or with the same host) within this many days. 0 skips the check.",
+)
+@click.option('--quiet', is_flag=True, help="Only print warnings and failures.")
+@click.option(
+    '--watch', 'watch_mode', is_flag=True,
+    help="Stay running and rebuild the local outputs (everything but webhooks) whenever templates or schemas change.",
+)
+@click.option(
+    '--schedule', 'schedule_mode', is_flag=True,
+    help="Stay running and rebuild exactly when the outputs next change (an occurrence passing or a week rolling over).",
+)
+@click.option(
+    '--serve', 'serve_mode', is_flag=True,
+    help="Stay running and serve old.json, the TextMeshPro text and the HTML over HTTP, worked out fresh each minute.",
+)
+@click.option('--host', default='127.0.0.1', show_default=True, help="Address to serve on, with --serve.")
+@click.option('--port', default=8080, show_default=True, help="Port to serve on, with --serve.")
+@click.option(
+    '--profile', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None, is_flag=False,
+    flag_value=pathlib.Path('build.prof'),
+    help="Profile the whole build with cProfile and write the stats here (build.prof if no path is given). "
+         "Runs everything on the main thread so the profile is complete.",
+)
+def main(
+    webhook_base_url: str | None,
+    webhook_concurrency: int,
+    webhook_state: pathlib.Path,
+    force_webhooks: bool,
+    no_cache: bool,
+    jobs: int | None,
+    format_patterns: tuple[str, ...],
+    lane_names: tuple[str, ...],
+    conflict_horizon: int,
+    quiet: bool,
+    watch_mode: bool,
+    schedule_mode: bool,
+    serve_mode: bool,
+    host: str,
+    port: int,
+    profile: pathlib.Path | None,
+):
+    reporting.reporter = BuildReporter(quiet=quiet)
 
-@contextlib.contextmanager
-def report_error(label: str):
-    click.secho(f"{label}... ", nl=False)
     try:
-        yield
-    except BaseException:
-        click.secho("FAILED", fg='red')
-        raise
-    else:
-        click.secho("OK", fg='green')
+        output_formats = select_formats(format_patterns) if format_patterns else OUTPUT_FORMATS
+    except KeyError as exception:
+        raise click.BadParameter(exception.args[0], param_hint="--format")
+
+    if lane_names:
+        unknown_lanes = set(lane_names) - {lane_folder.name for lane_folder in find_lane_folders()}
+
+        if unknown_lanes:
+            raise click.BadParameter(f"No event lane named {', '.join(sorted(unknown_lanes))}", param_hint="--lane")
+
+        # The global webhook message lists every lane's events, sending it from a few of them would wipe the rest
+        if format_patterns and any(output_format.publishes for output_format in output_formats):
+            raise click.UsageError("Webhooks can't be sent for a subset of lanes, leave them out of --format")
+
+        output_formats = [output_format for output_format in output_formats if not output_format.publishes]
+
+    if watch_mode + schedule_mode + serve_mode > 1:
+        raise click.UsageError("Only one of --watch, --schedule and --serve can be used at once")
+
+    if watch_mode:
+        # Only needed (along with watchdog) when watching
+        from watch import watch
+        watch(no_cache=no_cache, quiet=quiet, output_formats=output_formats, lane_names=set(lane_names) or None)
+        return
+
+    if serve_mode:
+        # Only needed (along with aiohttp's server) when serving
+        from server import serve
+        serve(host=host, port=port, no_cache=no_cache, output_formats=output_formats, lane_names=set(lane_names) or None)
+        return
+
+    arguments = {
+        "webhook_base_url": webhook_base_url,
+        "webhook_concurrency": webhook_concurrency,
+        "webhook_state": webhook_state,
+        "force_webhooks": force_webhooks,
+        "no_cache": no_cache,
+        "jobs": jobs,
+        "output_formats": output_formats,
+        "lane_names": set(lane_names) or None,
+        "conflict_horizon": datetime.timedelta(days=conflict_horizon) if conflict_horizon else None,
+    }
+
+    if schedule_mode:
+        from scheduler import run_scheduled
+        run_scheduled(quiet=quiet, **arguments)
+        return
+
+    if profile is None:
+        build(**arguments)
+        return
+
+    # cProfile only sees the thread it runs on, so keep formats and ingestion on it
+    profiler = cProfile.Profile()
 
+    try:
+        profiler.runcall(build, **{**arguments, "jobs": 1}, format_workers=1)
+    finally:
+        profiler.dump_stats(profile)
+        reporting.echo(f"Profile written to {profile}", fg='blue')
 
-@click.command()
-def main():
-    click.secho("Reading schemas...", fg='blue')
-
-    with report_error("  Parsing meta schema"):
-        with open(SCHEMA_FOLDER / 'template_meta.schema.json', 'r', encoding='utf-8') as fp:
-            meta_schema = json.load(fp)
-
-    with report_error("  Parsing events schema"):
-        with open(SCHEMA_FOLDER / 'template_events.schema.json', 'r', encoding='utf-8') as fp:
-            events_schema = json.load(fp)
-
-    click.secho("Reading event lane templates...", fg='blue')
-
-    event_lanes: list[EventLane] = []
-
-    for meta_path in TEMPLATES_FOLDER.glob("*/meta.yaml"):
-        event_lane_name = meta_path.parent.name
-        events_path = meta_path.parent / 'events.yaml'
-        click.secho(f"  Found event lane `{event_lane_name}`")
-
-        with report_error("    Parsing meta data"):
-            with open(meta_path, 'r', encoding='utf-8') as fp:
-                meta_data: EventLaneMeta = load(fp, Loader=SafeLineLoader)
-
-        with report_error("    Validating meta data against schema"):
-            jsonschema.validate(instance=meta_data, schema=meta_schema)
-
-        with report_error("    Parsing events data"):
-            with open(events_path, 'r', encoding='utf-8') as fp:
-                events_data: EventLaneRawEvents = load(fp, Loader=SafeLineLoader)
-
-        with report_error("    Validating events data against schema"):
-            jsonschema.validate(instance=events_data, schema=events_schema)
-
-        with report_error("    Converting events into agnostic times"):
-            events: list[EventLaneEvent] = []
-
-            for raw_event in events_data["events"]:
-                schedule = raw_event["schedule"]
-                # Get timezone name
-                timezone = schedule.get("timezone", None) or meta_data["default_timezone"]
-                # Calculate basis datetime
-                basis = datetime.datetime \
-                    .strptime(schedule["basis"], "%Y-%m-%d") \
-                    .replace(
-                        hour=schedule["hour"],
-                        minute=schedule["minute"],
-                        tzinfo=ZoneInfo(timezone)
-                    )
-
-                # Check days line up
-                basis_day = basis.strftime("%A")
-                claimed_day = schedule["day"]
-                assert \
-                    basis_day == claimed_day, \
-                    f"Event '{raw_event['name']}' w/ {raw_event['host']} in `{event_lane_name}` has basis time of {basis:%a %d %b %Y, %I:%M%p} but claims it is a {claimed_day}"
-
-                events.append(EventLaneEvent(
-                    defined_line=raw_event['__line__'],
-                    host=raw_event['host'],
-                    name=raw_event['name'],
-                    tags=raw_event['tags'],
-                    paused=raw_event.get('paused', False),
-                    basis=basis,
-                    timezone=timezone,
-                    interval=schedule.get('interval', None) or 7,
-                    not_before=datetime.datetime.strptime(schedule["not_before"], "%Y-%m-%d").date() if schedule.get("not_before", None) else None,
-                    not_after=datetime.datetime.strptime(schedule["not_after"], "%Y-%m-%d").date() if schedule.get("not_after", None) else None,
-                ))
-
-        with report_error("    Resolving webhook if present"):
-            webhook = None
-            webhook_info = None
-            webhook_message_id = None
-
-            webhook_info = meta_data.get('webhook', None)
-
-            if webhook_info is not None:
-                webhook_url = os.getenv(webhook_info['url'])
-                webhook_message_id_variable = webhook_info.get('message_id', None)
-
-                if webhook_message_id_variable:
-                    webhook_message_id_var = os.getenv(webhook_message_id_variable)
-                    if webhook_message_id_var:
-                        webhook_message_id = int(webhook_message_id_var)
-                else:
-                    webhook_message_id = None
-
-                if webhook_url:
-                    webhook = discord.SyncWebhook.from_url(webhook_url)
-
-                    if not webhook_message_id:
-                        click.secho(f"Warning: no existing webhook message ID found for {event_lane_name}", fg='yellow')
-                else:
-                    click.secho(f"Warning: no webhook URL found for {event_lane_name}", fg='yellow')
-
-        event_lane = EventLane(
-            name=event_lane_name,
-            meta=meta_data,
-            events=events,
-            webhook=webhook,
-            webhook_info=webhook_info,
-            webhook_message_id=webhook_message_id,
-        )
-
-        event_lanes.append(event_lane)
-
-    click.secho("Generating output formats...", fg='blue')
-
-    OUTPUT_FOLDER.mkdir(exist_ok=True)
-
-    for callback, target_filename in OUTPUT_FORMATS:
-        with report_error(f"    Generating {target_filename}"):
-            output = callback(event_lanes)
-
-            with open(OUTPUT_FOLDER / target_filename, 'w', encoding='utf-8') as fp:
-                if isinstance(output, str):
-                    fp.write(output)
-                else:
-                    json.dump(output, fp, indent=2)
+        if not quiet:
+            pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
 
 
 if __name__ == '__main__':
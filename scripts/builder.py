@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+"""
+The steps of a build, shared by the one-shot build and the resident modes.
+"""
+
+import datetime
+import json
+import os
+import pathlib
+import typing
+
+import click
+
+import reporting
+from conflicts import DEFAULT_HORIZON, Conflict, find_conflicts
+from definitions import EventLane, EventLaneMeta, ScheduleChange
+from formats.all import OUTPUT_FORMATS, SHARED_INPUTS, OutputFormat
+from ingestion import (
+    EVENTS_SCHEMA_PATH, META_SCHEMA_PATH, TEMPLATES_FOLDER, IngestedLane, LaneCache, TemplateSchemas, ingest_lanes,
+)
+from output import HASH_MANIFEST_FILENAME, OutputWriter
+from pipeline import Pipeline
+from publisher import WebhookPublisher, validate_webhook_url
+from reporting import Elapsed, Stopwatch, report_error, report_result
+
+
+SCRIPTS_FOLDER = pathlib.Path(__file__).parent
+OUTPUT_FOLDER = SCRIPTS_FOLDER.parent / 'output'
+
+METRICS_FILENAME = 'build_metrics.json'
+
+
+def find_lane_folders() -> list[pathlib.Path]:
+    return [meta_path.parent for meta_path in TEMPLATES_FOLDER.glob("*/meta.yaml")]
+
+
+def load_schemas() -> tuple[dict[str, typing.Any], dict[str, typing.Any]]:
+    with report_error("  Parsing meta schema", stage="schema"):
+        with open(META_SCHEMA_PATH, 'r', encoding='utf-8') as fp:
+            meta_schema = json.load(fp)
+
+    with report_error("  Parsing events schema", stage="schema"):
+        with open(EVENTS_SCHEMA_PATH, 'r', encoding='utf-8') as fp:
+            events_schema = json.load(fp)
+
+    return meta_schema, events_schema
+
+
+def resolve_webhook(event_lane_name: str, meta_data: EventLaneMeta) -> tuple[str | None, int | None]:
+    webhook = None
+    webhook_message_id = None
+
+    webhook_info = meta_data.get('webhook', None)
+
+    if webhook_info is not None:
+        webhook_url = os.getenv(webhook_info['url'])
+        webhook_message_id_variable = webhook_info.get('message_id', None)
+
+        if webhook_message_id_variable:
+            webhook_message_id_var = os.getenv(webhook_message_id_variable)
+            if webhook_message_id_var:
+                webhook_message_id = int(webhook_message_id_var)
+        else:
+            webhook_message_id = None
+
+        if webhook_url:
+            webhook = validate_webhook_url(webhook_url)
+
+            if not webhook_message_id:
+                reporting.warn(f"Warning: no existing webhook message ID found for {event_lane_name}")
+        else:
+            reporting.warn(f"Warning: no webhook URL found for {event_lane_name}")
+
+    return webhook, webhook_message_id
+
+
+def create_event_lane(ingested_lane: IngestedLane, resolve_webhooks: bool = True) -> EventLane:
+    webhook, webhook_message_id = None, None
+
+    if resolve_webhooks:
+        with report_error("    Resolving webhook if present", stage="webhook_resolve", lane=ingested_lane.name):
+            webhook, webhook_message_id = resolve_webhook(ingested_lane.name, ingested_lane.meta)
+
+    return EventLane(
+        name=ingested_lane.name,
+        meta=ingested_lane.meta,
+        events=ingested_lane.events,
+        webhook_url=webhook,
+        webhook_info=ingested_lane.meta.get('webhook', None),
+        webhook_message_id=webhook_message_id,
+    )
+
+
+def load_event_lanes(
+    lane_folders: list[pathlib.Path],
+    meta_schema: dict[str, typing.Any],
+    events_schema: dict[str, typing.Any],
+    lane_cache: LaneCache,
+    jobs: int | None = None,
+    template_schemas: TemplateSchemas | None = None,
+    resolve_webhooks: bool = True,
+) -> list[EventLane]:
+    event_lanes: list[EventLane] = []
+    lanes = ingest_lanes(lane_folders, meta_schema, events_schema, lane_cache, jobs, template_schemas)
+
+    for event_lane_name, ingested_lane, exception in lanes:
+        reporting.echo(f"  Found event lane `{event_lane_name}`")
+
+        if ingested_lane is not None and ingested_lane.cached:
+            # Nothing that goes into this lane has changed since it was last converted
+            report_result("    Loading cached lane (templates unchanged)", exception)
+        else:
+            report_result("    Parsing, validating and converting events into agnostic times", exception)
+
+        if exception is not None:
+            reporting.reporter.record("ingest", Elapsed(0.0, 0.0), lane=event_lane_name, failed=True)
+            raise click.ClickException(f"Could not load event lane `{event_lane_name}`")
+
+        reporting.reporter.record_timings(ingested_lane.timings, lane=event_lane_name)
+        event_lanes.append(create_event_lane(ingested_lane, resolve_webhooks))
+
+    return event_lanes
+
+
+def check_conflicts(event_lanes: list[EventLane], now: datetime.datetime, horizon: datetime.timedelta) -> list[Conflict]:
+    """
+    Warns about (and returns) overlapping events from `now` to `horizon` ahead, which should be the build's snapshot
+    time so the warnings cover the same window as the outputs.
+    """
+
+    with report_error("  Checking for overlapping events", stage="conflicts"):
+        conflicts = find_conflicts(event_lanes, now, now + horizon)
+
+    # Worth fixing, but not worth failing the build (and holding back every other change) over
+    for conflict in conflicts:
+        reporting.warn(f"Warning: {conflict.describe()}")
+
+    return conflicts
+
+
+def render_formats(
+    pipeline: Pipeline,
+    output_formats: list[OutputFormat],
+    output_writer: OutputWriter,
+    format_workers: int | None = None,
+) -> int:
+    """
+    Generates and writes every format, returning how many failed.
+    """
+
+    failures = 0
+
+    # Formats run concurrently, so report each one as it finishes rather than as it starts
+    for output_format, output, exception, elapsed in pipeline.run(output_formats, max_workers=format_workers):
+        stopwatch = Stopwatch()
+
+        if exception is None and output_format.streams:
+            changed = any(name in output_writer.changed for name in output)
+        elif exception is None:
+            try:
+                changed = output_writer.write(
+                    output_format.target_filename,
+                    output if isinstance(output, str) else json.dumps(output, indent=2),
+                )
+            except Exception as write_exception:
+                exception = write_exception
+
+        reporting.reporter.record(f"format:{output_format.target_filename}", elapsed, failed=exception is not None)
+        reporting.reporter.record(f"write:{output_format.target_filename}", stopwatch.elapsed(), failed=exception is not None)
+
+        report_result(
+            f"    Generating {', '.join(output_format.filenames)}" + ("" if exception or changed else " (unchanged)"),
+            exception,
+        )
+
+        if exception is not None:
+            failures += 1
+
+    for name, elapsed in pipeline.timings.items():
+        items = None
+
+        if name == "snapshot":
+            items = sum(map(len, pipeline.resolve("snapshot").lane_occurrences.values()))
+
+        reporting.reporter.record(name, elapsed, items)
+
+    return failures
+
+
+def build(
+    webhook_base_url: str | None = None,
+    webhook_concurrency: int = 4,
+    webhook_state: pathlib.Path = OUTPUT_FOLDER / 'webhook.json',
+    force_webhooks: bool = False,
+    no_cache: bool = False,
+    jobs: int | None = None,
+    format_workers: int | None = None,
+    output_formats: list[OutputFormat] = OUTPUT_FORMATS,
+    lane_names: set[str] | None = None,
+    conflict_horizon: datetime.timedelta | None = DEFAULT_HORIZON,
+) -> ScheduleChange | None:
+    """
+    Builds `output_formats` from every lane, or only the lanes in `lane_names`, returning when they next change.
+
+    Overlapping events are warned about up to `conflict_horizon` ahead, unless it's None.
+    """
+
+    publishing = any(output_format.publishes for output_format in output_formats)
+
+    reporting.echo("Reading schemas...", fg='blue')
+
+    meta_schema, events_schema = load_schemas()
+
+    reporting.echo("Reading event lane templates...", fg='blue')
+
+    lane_cache = LaneCache(enabled=not no_cache)
+    lane_folders = [
+        lane_folder for lane_folder in find_lane_folders()
+        if lane_names is None or lane_folder.name in lane_names
+    ]
+    event_lanes = load_event_lanes(lane_folders, meta_schema, events_schema, lane_cache, jobs, resolve_webhooks=publishing)
+
+    previous_webhooks = {}
+
+    if publishing and webhook_state.exists() and not force_webhooks:
+        with report_error("  Reading previous webhook state"):
+            with open(webhook_state, 'r', encoding='utf-8') as fp:
+                previous_webhooks = json.load(fp)
+
+    OUTPUT_FOLDER.mkdir(exist_ok=True)
+    output_writer = OutputWriter(OUTPUT_FOLDER)
+
+    pipeline = Pipeline({
+        "event_lanes": event_lanes,
+        "webhook_publisher": WebhookPublisher(base_url=webhook_base_url, max_in_flight=webhook_concurrency),
+        "previous_webhooks": previous_webhooks,
+        "output_writer": output_writer,
+    }, SHARED_INPUTS)
+
+    if conflict_horizon is not None:
+        # From the same "now" as every output
+        check_conflicts(event_lanes, pipeline.resolve("snapshot").now, conflict_horizon)
+
+    reporting.echo("Generating output formats...", fg='blue')
+
+    failures = render_formats(pipeline, output_formats, output_writer, format_workers)
+
+    with report_error("  Writing output hash manifest", stage="write:" + HASH_MANIFEST_FILENAME):
+        changed_outputs = output_writer.finish()
+
+    reporting.echo(f"{len(changed_outputs)} output file(s) changed", fg='blue')
+
+    with report_error("  Writing build metrics"):
+        reporting.reporter.write(OUTPUT_FOLDER / METRICS_FILENAME)
+
+    if failures:
+        raise click.ClickException(f"{failures} output format(s) failed to generate")
+
+    next_change = pipeline.resolve("snapshot").next_change()
+
+    if next_change is not None:
+        reporting.echo(f"Outputs next change at {next_change.when.astimezone(datetime.UTC):%Y-%m-%d %H:%M:%S} UTC, when {next_change.reason}", fg='blue')
+
+    return next_change
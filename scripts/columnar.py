@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar (NumPy) representation of a lane's events, for working out every event's next occurrence in one go.
+
+NumPy is optional, `available()` says whether it can be used. Callers fall back to the per-event methods otherwise.
+"""
+
+import datetime
+import typing
+from zoneinfo import ZoneInfo
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from transitions import SECOND, find_transitions, offset_at
+
+if typing.TYPE_CHECKING:
+    from definitions import EventLaneEvent
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DAY_SECONDS = 24 * 60 * 60
+
+# Stands in for "no occurrence" (and "no bound") in the int64 columns
+NO_INDEX = 2 ** 63 - 1
+
+# Transition tables are worked out this far either side of what's asked for, so nearby queries reuse them
+TRANSITION_MARGIN_DAYS = 366
+
+
+def available() -> bool:
+    return numpy is not None
+
+
+def wall_seconds(when: datetime.datetime) -> int:
+    # Seconds since the epoch as if the local wall-clock time were UTC
+    return (when.replace(tzinfo=None) - EPOCH) // datetime.timedelta(seconds=1)
+
+
+class ZoneTransitions:
+    """
+    A time zone's UTC offsets as a table over wall-clock time, so offsets for many wall-clock times can be looked
+    up at once.
+
+    Like `datetime`, wall-clock times skipped or repeated by a transition use the offset from before it (fold=0).
+    """
+
+    def __init__(self, zone: ZoneInfo):
+        self.zone = zone
+        self.start: int | None = None
+        self.end: int | None = None
+        self.boundaries: list[int] = []
+        self.offsets: list[int] = []
+
+    def find_transitions(self, start: int, end: int) -> tuple[list[int], list[int]]:
+        """
+        Wall-clock boundaries and the offsets either side of them for transitions in [start, end), plus the offset
+        before the first one.
+        """
+
+        start_time = datetime.datetime.fromtimestamp(start, datetime.UTC)
+        end_time = datetime.datetime.fromtimestamp(end, datetime.UTC)
+        boundaries = []
+        offsets = [offset_at(self.zone, start_time) // SECOND]
+
+        for transition in find_transitions(self.zone, start_time, end_time):
+            boundaries.append(int(transition.when.timestamp()) + max(transition.before, transition.after) // SECOND)
+            offsets.append(transition.after // SECOND)
+
+        return boundaries, offsets
+
+    def cover(self, start: int, end: int):
+        if self.start is not None and self.start <= start and end <= self.end:
+            return
+
+        # Rebuild over the union of what was and is needed, it's cheap enough not to bother splicing
+        start = min(start, self.start if self.start is not None else start) - TRANSITION_MARGIN_DAYS * DAY_SECONDS
+        end = max(end, self.end if self.end is not None else end) + TRANSITION_MARGIN_DAYS * DAY_SECONDS
+        self.boundaries, self.offsets = self.find_transitions(start, end)
+        self.start, self.end = start, end
+
+    def offsets_for(self, wall: "numpy.ndarray") -> "numpy.ndarray":
+        if not len(wall):
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        # Instants within a day of the wall-clock times bracket them
+        self.cover(int(wall.min()) - DAY_SECONDS, int(wall.max()) + DAY_SECONDS)
+
+        return numpy.asarray(self.offsets, dtype=numpy.int64)[
+            numpy.searchsorted(numpy.asarray(self.boundaries, dtype=numpy.int64), wall, side='right')
+        ]
+
+
+# Shared between lanes, keyed by zone name
+ZONE_TRANSITIONS: dict[str, ZoneTransitions] = {}
+
+
+def zone_transitions(timezone: str) -> ZoneTransitions:
+    if timezone not in ZONE_TRANSITIONS:
+        ZONE_TRANSITIONS[timezone] = ZoneTransitions(ZoneInfo(timezone))
+
+    return ZONE_TRANSITIONS[timezone]
+
+
+class ColumnarEvents:
+    """
+    A lane's events as columns: basis (as both wall-clock and UTC seconds), interval, bounds (as occurrence indices)
+    and whether each is paused, plus a code for each event's time zone so wall-clock arithmetic is done per zone.
+
+    Occurrence `k` of an event is at wall-clock time `basis + k * interval` in its zone, as with
+    `EventLaneEvent.occurrence_at`.
+    """
+
+    def __init__(self, events: list["EventLaneEvent"]):
+        if numpy is None:
+            raise RuntimeError("Columnar events need numpy")
+
+        # The events themselves (slotted records, see EventLaneEvent) are kept for everything that isn't a number
+        self.events = events
+
+        count = len(events)
+        self.basis_wall = numpy.fromiter((wall_seconds(event.basis) for event in events), dtype=numpy.int64, count=count)
+        self.basis_utc = numpy.fromiter((int(event.basis.timestamp()) for event in events), dtype=numpy.int64, count=count)
+        self.interval = numpy.fromiter((event.interval * DAY_SECONDS for event in events), dtype=numpy.int64, count=count)
+        self.paused = numpy.fromiter((event.paused for event in events), dtype=numpy.bool_, count=count)
+
+        # Bounds as occurrence indices, matching first_occurrence_index and next_occurrence_after
+        self.first_index = numpy.fromiter((
+            event.first_index_on(event.not_before) if event.not_before else -NO_INDEX
+            for event in events
+        ), dtype=numpy.int64, count=count)
+        self.last_index = numpy.fromiter((
+            event.first_index_on(event.not_after + datetime.timedelta(days=1)) - 1 if event.not_after else NO_INDEX
+            for event in events
+        ), dtype=numpy.int64, count=count)
+
+        zone_names = sorted({event.timezone for event in events})
+        zone_codes = {timezone: code for code, timezone in enumerate(zone_names)}
+        self.zone_code = numpy.fromiter((zone_codes[event.timezone] for event in events), dtype=numpy.int64, count=count)
+        self.zones = [(code, zone_transitions(timezone)) for timezone, code in zone_codes.items()]
+
+    def utc_at(self, indices: "numpy.ndarray", index: "numpy.ndarray") -> "numpy.ndarray":
+        """
+        UTC seconds of occurrence `index[i]` of event `indices[i]`.
+        """
+
+        wall = self.basis_wall[indices] + index * self.interval[indices]
+        utc = numpy.empty_like(wall)
+
+        zone_code = self.zone_code[indices]
+
+        for code, transitions in self.zones:
+            mask = zone_code == code
+            utc[mask] = wall[mask] - transitions.offsets_for(wall[mask])
+
+        return utc
+
+    def next_occurrence_indices(self, target: datetime.datetime) -> "numpy.ndarray":
+        """
+        The index of every event's next occurrence at or after `target`, or NO_INDEX if it has none.
+        """
+
+        # Occurrences are on whole seconds, so the first one at or after the target is at or after its ceiling
+        target_seconds = -((EPOCH.replace(tzinfo=datetime.UTC) - target) // datetime.timedelta(seconds=1))
+        indices = numpy.arange(len(self.events))
+
+        # Estimate from the absolute time elapsed since the basis. Offsets change by less than a day, and intervals are
+        #  at least a day, so the answer is the estimate or one of the next two
+        estimate = numpy.floor_divide(target_seconds - self.basis_utc, self.interval)
+        index = estimate + 2
+
+        for step in (1, 0):
+            candidate = estimate + step
+            index = numpy.where(self.utc_at(indices, candidate) >= target_seconds, candidate, index)
+
+        index = numpy.maximum(index, self.first_index)
+
+        return numpy.where(self.paused | (index > self.last_index), NO_INDEX, index)
+
+    def next_occurrences(self, target: datetime.datetime) -> list[datetime.datetime | None]:
+        return [
+            None if index == NO_INDEX else event.occurrence_at(index)
+            for event, index in zip(self.events, self.next_occurrence_indices(target).tolist())
+        ]
+
+    def next_occurrences_sorted(self, target: datetime.datetime) -> list[tuple[datetime.datetime, "EventLaneEvent"]]:
+        """
+        Every event's next occurrence at or after `target`, sorted by time (ties in definition order).
+        """
+
+        occurrences = [
+            (event.occurrence_at(index), event)
+            for event, index in zip(self.events, self.next_occurrence_indices(target).tolist()) if index != NO_INDEX
+        ]
+
+        # Sorted as datetimes rather than by UTC seconds: times in the same zone compare by wall-clock time, which
+        #  orders occurrences that fall in a DST gap differently, and this has to agree with the per-event path
+        occurrences.sort(key=lambda occurrence: occurrence[0])
+
+        return occurrences
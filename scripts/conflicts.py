@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Finding events that overlap in time: two in the same lane, or two with the same host in any lanes.
+"""
+
+import datetime
+import heapq
+import typing
+
+from definitions import EventLane, EventOccurrence
+
+
+# How far ahead occurrences are checked. Long enough to cover every combination of weekly and fortnightly events
+DEFAULT_HORIZON = datetime.timedelta(days=28)
+
+
+class Conflict(typing.NamedTuple):
+    # The one that starts first (or is defined first, if they start together)
+    first: EventOccurrence
+    second: EventOccurrence
+
+    def describe(self) -> str:
+        first, second = self.first, self.second
+        shared = "lane" if first.event_lane.name == second.event_lane.name else "host"
+
+        return (
+            f"`{first.event.name}` w/ {first.event.host} ({first.event_lane.name}, line {first.event.defined_line}) "
+            f"overlaps `{second.event.name}` w/ {second.event.host} ({second.event_lane.name}, line {second.event.defined_line}), "
+            f"which shares its {shared}, at {second.when.astimezone(datetime.UTC):%Y-%m-%d %H:%M} UTC"
+        )
+
+
+def occurrence_end(occurrence: EventOccurrence) -> datetime.datetime:
+    return occurrence.when + datetime.timedelta(minutes=occurrence.event.duration)
+
+
+def find_conflicts(
+    event_lanes: list[EventLane],
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> list[Conflict]:
+    """
+    Every pair of events whose occurrences in [start, end) overlap and share a lane or a host, each reported once (at
+    the first time they overlap).
+
+    Occurrences are swept in start order. Rather than one list of everything in progress, which every occurrence would
+    have to be checked against, what's in progress is kept per lane and per host, so each occurrence only meets the
+    occurrences it could conflict with and the sweep stays quick when every lane is checked together.
+    """
+
+    occurrences = heapq.merge(*[
+        [EventOccurrence(when, event_lane, event) for when in event.occurrences_between(start, end)]
+        for event_lane in event_lanes for event in event_lane.events
+    ], key=lambda occurrence: occurrence.when)
+
+    # Lane and host -> the occurrences in progress, as (end, occurrence)
+    in_progress: dict[tuple[str, str], list[tuple[datetime.datetime, EventOccurrence]]] = {}
+    # Keyed by both events, whichever starts first
+    conflicts: dict[frozenset[int], Conflict] = {}
+
+    for occurrence in occurrences:
+        keys = [("lane", occurrence.event_lane.name), ("host", occurrence.event.host)]
+        overlapping: dict[int, EventOccurrence] = {}
+
+        for key in keys:
+            # Drop anything that has finished, touching end to start isn't an overlap
+            current = [item for item in in_progress.get(key, []) if item[0] > occurrence.when]
+            in_progress[key] = current
+
+            for _, other in current:
+                overlapping[id(other.event)] = other
+
+        for other in overlapping.values():
+            if other.event is occurrence.event:
+                continue
+
+            pair = frozenset((id(other.event), id(occurrence.event)))
+
+            if pair not in conflicts:
+                conflicts[pair] = Conflict(other, occurrence)
+
+        for key in keys:
+            in_progress[key].append((occurrence_end(occurrence), occurrence))
+
+    return list(conflicts.values())
+
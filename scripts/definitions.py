@@ -6,9 +6,15 @@ Types, dataclasses, etc.
 
 import dataclasses
 import datetime
+import functools
+import hashlib
+import heapq
+import math
 import typing
+from zoneinfo import ZoneInfo
 
-import discord
+if typing.TYPE_CHECKING:
+    from columnar import ColumnarEvents
 
 
 class EventLaneLanguageInfo(typing.TypedDict):
@@ -39,6 +45,7 @@ class EventLaneRawEventSchedule(typing.TypedDict):
     hour: int
     minute: int
     interval: typing.NotRequired[int]
+    duration: typing.NotRequired[int]
     not_before: typing.NotRequired[str]
     not_after: typing.NotRequired[str]
 
@@ -56,47 +63,223 @@ class EventLaneRawEvents(typing.TypedDict):
     events: list[EventLaneRawEvent]
 
 
-@dataclasses.dataclass(frozen=True)
+# Slotted, as there can be tens of thousands of these and a __dict__ each would be most of their size. The numbers
+#  are also kept as NumPy columns for big lanes (see columnar.py), with these as the records for everything else
+@dataclasses.dataclass(frozen=True, slots=True)
 class EventLaneEvent:
     defined_line: int
     host: str
     name: str
-    tags: list[str]
+    # A tuple so events can be hashed, and so used as cache keys
+    tags: tuple[str, ...]
     paused: bool
     basis: datetime.datetime
     timezone: str
     interval: int
+    # Minutes
+    duration: int
     not_before: datetime.date | None
     not_after: datetime.date | None
 
+    def occurrence_at(self, index: int) -> datetime.datetime:
+        # Adding days to an aware datetime keeps its wall-clock time, so DST shifts are handled for us
+        return self.basis + datetime.timedelta(days=index * self.interval)
+
+    def first_index_on(self, day: datetime.date) -> int:
+        """
+        The index of the first occurrence on or after `day`.
+        """
+
+        # Whole intervals since the basis date is only an estimate, as a fractional interval can carry an occurrence
+        #  past midnight onto the next day
+        index = math.floor((day - self.basis.date()).days / self.interval)
+
+        while self.occurrence_at(index).date() >= day:
+            index -= 1
+
+        while self.occurrence_at(index).date() < day:
+            index += 1
+
+        return index
+
+    def first_occurrence_index(self, target: datetime.datetime) -> int:
+        # Estimate the index from the absolute time elapsed since the basis
+        index = math.floor((target - self.basis) / datetime.timedelta(days=self.interval))
+
+        # The estimate can be off by one either way when a DST shift sits between the basis and the target
+        while self.occurrence_at(index) < target:
+            index += 1
+
+        while self.occurrence_at(index - 1) >= target:
+            index -= 1
+
+        # Jump straight past anything before the not_before date
+        if self.not_before:
+            index = max(index, self.first_index_on(self.not_before))
+
+        return index
+
     def next_occurrence_after(self, target: datetime.datetime) -> typing.Optional[datetime.datetime]:
         # If paused, no next occurrence
         if self.paused:
             return None
 
-        # Calculate the amount of days that have passed since the basis
-        days_since_basis = (target - self.basis).days
-        # Start search from floored interval from basis
-        starting_day_offset = int(days_since_basis / self.interval) * self.interval
-        needle = self.basis + datetime.timedelta(days=starting_day_offset)
-
-        while needle < target or (needle.date() < self.not_before if self.not_before else False):
-            needle += datetime.timedelta(days=self.interval)
-
-            if self.not_after and needle.date() > self.not_after:
-                return None
+        needle = self.occurrence_at(self.first_occurrence_index(target))
 
         if self.not_after and needle.date() > self.not_after:
             return None
 
         return needle
 
+    def occurrences_between(self, start: datetime.datetime, end: datetime.datetime) -> typing.Iterator[datetime.datetime]:
+        """
+        Lazily yields every occurrence in the half-open range [start, end).
+        """
+
+        if self.paused:
+            return
+
+        index = self.first_occurrence_index(start)
+
+        while True:
+            needle = self.occurrence_at(index)
+
+            if needle >= end or (self.not_after and needle.date() > self.not_after):
+                return
+
+            yield needle
+            index += 1
+
 
 @dataclasses.dataclass(frozen=True)
 class EventLane:
     name: str
     meta: EventLaneMeta
     events: list[EventLaneEvent]
-    webhook: discord.SyncWebhook | None
+    webhook_url: str | None
     webhook_info: EventLaneWebhookInfo | None
     webhook_message_id: int | None
+
+    def week_start(self, now: datetime.datetime) -> datetime.datetime:
+        """
+        When the lane's current week started: 5am on Monday in its default timezone.
+        """
+
+        zone = ZoneInfo(self.meta["default_timezone"])
+        now = now.astimezone(zone)
+        last_monday_5am = (now - datetime.timedelta(days=now.weekday())).replace(hour=5, minute=0, second=0, microsecond=0)
+
+        # If it's, for example, 4am on a Monday, we still don't consider the week turned over yet so use last week
+        if last_monday_5am > now:
+            last_monday_5am = last_monday_5am - datetime.timedelta(days=7)
+
+        return last_monday_5am
+
+    @functools.cached_property
+    def columns(self) -> "ColumnarEvents":
+        # Only built for lanes big enough to need it (see ScheduleSnapshot.build), and kept for as long as the lane is
+        from columnar import ColumnarEvents
+
+        return ColumnarEvents(self.events)
+
+
+# Lanes with at least this many events have their next occurrences worked out as columns with NumPy (if installed),
+#  below it the per-event methods are quicker than setting up the arrays
+COLUMNAR_THRESHOLD = 64
+
+
+def columnar_available() -> bool:
+    # Imported late so builds with only small lanes never import NumPy
+    import columnar
+
+    return columnar.available()
+
+
+class EventOccurrence(typing.NamedTuple):
+    when: datetime.datetime
+    event_lane: EventLane
+    event: EventLaneEvent
+
+
+def event_identity(event_lane: EventLane, event: EventLaneEvent) -> bytes:
+    # What makes an event the same event from build to build. Anything else about it (tags, pauses, bounds) can
+    #  change without it becoming a different event
+    return "\0".join([event_lane.name, event.host, event.name, event.basis.isoformat(), event.timezone]).encode('utf-8')
+
+
+def event_id(event_lane: EventLane, event: EventLaneEvent) -> int:
+    # 52 bits, so it's exact as a JavaScript number (and in anything else that parses JSON numbers as doubles)
+    return int.from_bytes(hashlib.sha256(event_identity(event_lane, event)).digest()[:7], 'big') >> 4
+
+
+class ScheduleChange(typing.NamedTuple):
+    when: datetime.datetime
+    reason: str
+
+
+@dataclasses.dataclass(frozen=True)
+class ScheduleSnapshot:
+    """
+    Everything the output formats need to know about the schedule at a single point in time.
+
+    This is built once per build so that every format agrees on what "now" is and occurrence math is only done once.
+    """
+
+    now: datetime.datetime
+    event_lanes: list[EventLane]
+    # Next occurrence of every (unpaused, unexpired) event in each lane, sorted by time
+    lane_occurrences: dict[str, list[EventOccurrence]]
+
+    @classmethod
+    def build(cls, event_lanes: list[EventLane], now: datetime.datetime | None = None) -> "ScheduleSnapshot":
+        now = now or datetime.datetime.now(datetime.UTC)
+        lane_occurrences: dict[str, list[EventOccurrence]] = {}
+
+        for event_lane in event_lanes:
+            if len(event_lane.events) >= COLUMNAR_THRESHOLD and columnar_available():
+                lane_occurrences[event_lane.name] = [
+                    EventOccurrence(when, event_lane, event) for when, event in event_lane.columns.next_occurrences_sorted(now)
+                ]
+                continue
+
+            occurrences = []
+
+            for event in event_lane.events:
+                next_occurrence = event.next_occurrence_after(now)
+
+                if next_occurrence is not None:
+                    occurrences.append(EventOccurrence(next_occurrence, event_lane, event))
+
+            occurrences.sort(key=lambda occurrence: occurrence.when)
+            lane_occurrences[event_lane.name] = occurrences
+
+        return cls(now=now, event_lanes=event_lanes, lane_occurrences=lane_occurrences)
+
+    def upcoming(self) -> typing.Iterator[EventOccurrence]:
+        # Each lane is already sorted so a k-way merge is enough, and ties keep lane order like a stable sort would
+        return heapq.merge(*self.lane_occurrences.values(), key=lambda occurrence: occurrence.when)
+
+    def next_change(self) -> ScheduleChange | None:
+        """
+        The next moment any output would come out differently, which is the earliest of:
+
+        - an upcoming occurrence passing, after which its event moves on to its next occurrence (or drops out, at its
+           not_after date). Next occurrences already skip ahead to not_before, so that boundary is covered too.
+        - a lane's week rolling over, which changes the days its webhook message lists.
+        """
+
+        changes = []
+
+        for event_lane in self.event_lanes:
+            occurrences = self.lane_occurrences[event_lane.name]
+
+            if occurrences:
+                changes.append(ScheduleChange(
+                    occurrences[0].when, f"`{occurrences[0].event.name}` in `{event_lane.name}` starts",
+                ))
+
+            changes.append(ScheduleChange(
+                event_lane.week_start(self.now) + datetime.timedelta(days=7), f"`{event_lane.name}` rolls over to the next week",
+            ))
+
+        return min(changes, key=lambda change: change.when, default=None)
@@ -1,28 +1,123 @@
-
+import fnmatch
 import functools
+import importlib
+import types
 import typing
 
-from definitions import EventLane
-
-from formats.html import generate_html
-from formats.old import generate_old_format
-from formats.textmeshpro import generate_textmeshpro_special, generate_textmeshpro_text
-from formats.webhook import send_webhooks
+from definitions import ScheduleSnapshot
+from formats.localization import LOCALIZATIONS
+from occurrences import OccurrenceIndex
+from pipeline import Provider
+from transitions import TransitionTable
 
 
 __all__: typing.List[str] = [
-    "OUTPUT_FORMATS"
+    "OutputFormat",
+    "OUTPUT_FORMATS",
+    "SHARED_INPUTS",
+    "select_formats",
 ]
 
 
-OUTPUT_FORMATS: list[tuple[
-    typing.Callable[[list[EventLane]], typing.Union[str, dict[str, typing.Any]]], str
-]] = [
-    (generate_old_format, "old.json"),
-    (functools.partial(generate_html, language='en'), "index.html"),
-    (functools.partial(generate_html, language='ja'), "index.ja.html"),
-    (functools.partial(generate_textmeshpro_text, language='en'), "textmeshpro.en.txt"),
-    (functools.partial(generate_textmeshpro_text, language='ja'), "textmeshpro.ja.txt"),
-    (generate_textmeshpro_special, "textmeshpro.special.txt"),
-    (send_webhooks, "webhook.json"),
+@functools.lru_cache(maxsize=None)
+def import_callback(reference: str) -> typing.Callable[..., typing.Any]:
+    module_name, _, attribute = reference.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class OutputFormat(typing.NamedTuple):
+    # "module:function" of the callback, only imported once the format runs so a build that skips a format doesn't
+    #  pay for its dependencies (e.g. discord for webhooks, jinja2 for HTML)
+    function: str
+    target_filename: str
+    # Names of the inputs passed (in order) to the callback, resolved from SHARED_INPUTS
+    requires: tuple[str, ...] = ("snapshot",)
+    # Jinja templates (in scripts/templates) the output is rendered from, so it can be re-rendered when they change
+    templates: tuple[str, ...] = ()
+    # Extra keyword arguments for the callback
+    keywords: typing.Mapping[str, typing.Any] = types.MappingProxyType({})
+    # Writes its own files through the output writer (which it requires), returning their names, rather than
+    #  returning its content to be written to `target_filename`
+    streams: bool = False
+    # Other files it writes alongside `target_filename` (e.g. the same page in other languages, written in one pass)
+    also_writes: tuple[str, ...] = ()
+
+    @property
+    def filenames(self) -> tuple[str, ...]:
+        return (self.target_filename, *self.also_writes)
+
+    @property
+    def callback(self) -> typing.Callable[..., typing.Union[str, list[typing.Any], dict[str, typing.Any]]]:
+        return functools.partial(import_callback(self.function), **self.keywords)
+
+    @property
+    def publishes(self) -> bool:
+        # Sends something out (i.e. webhooks to Discord) rather than only producing a file
+        return "webhook_publisher" in self.requires
+
+
+def output_filenames() -> list[str]:
+    # Every file a build writes, for the pages to link to
+    return [filename for output_format in OUTPUT_FORMATS for filename in output_format.filenames]
+
+
+# Intermediate results that are computed once and shared by every format that requires them
+SHARED_INPUTS: dict[str, Provider] = {
+    "snapshot": Provider(ScheduleSnapshot.build, ("event_lanes",)),
+    "occurrence_index": Provider(OccurrenceIndex.build, ("snapshot",)),
+    "transitions": Provider(TransitionTable.build, ("snapshot",)),
+    "output_filenames": Provider(output_filenames, ()),
+}
+
+
+# Every language is written by one format, from one pass over the events
+HTML_FILENAMES = tuple(localization.html_filename for localization in LOCALIZATIONS.values())
+TEXTMESHPRO_FILENAMES = tuple(localization.textmeshpro_filename for localization in LOCALIZATIONS.values())
+
+OUTPUT_FORMATS: list[OutputFormat] = [
+    OutputFormat("formats.old:generate_old_format", "old.json"),
+    OutputFormat(
+        "formats.html:generate_html", HTML_FILENAMES[0], ("snapshot", "transitions", "output_writer", "output_filenames"),
+        templates=(*(localization.html_template for localization in LOCALIZATIONS.values()), "base.jinja2"),
+        streams=True, also_writes=HTML_FILENAMES[1:],
+    ),
+    OutputFormat(
+        "formats.textmeshpro:generate_textmeshpro_text", TEXTMESHPRO_FILENAMES[0], ("snapshot", "transitions", "output_writer"),
+        streams=True, also_writes=TEXTMESHPRO_FILENAMES[1:],
+    ),
+    OutputFormat("formats.textmeshpro:generate_textmeshpro_special", "textmeshpro.special.txt", ("snapshot", "transitions")),
+    OutputFormat("formats.next_change:generate_next_change", "next_change.json"),
+    OutputFormat("formats.ical:generate_ical", "calendar/all.ics", ("snapshot", "output_writer"), streams=True),
+    OutputFormat("formats.feed:generate_feed", "feed/latest.json", ("snapshot", "output_writer"), streams=True),
+    OutputFormat(
+        "formats.webhook:send_webhooks", "webhook.json",
+        ("snapshot", "occurrence_index", "transitions", "webhook_publisher", "previous_webhooks"),
+    ),
 ]
+
+
+def select_formats(patterns: typing.Iterable[str], output_formats: list[OutputFormat] = OUTPUT_FORMATS) -> list[OutputFormat]:
+    """
+    The formats with a filename that matches any of `patterns` (e.g. "index.html" or "textmeshpro.*").
+
+    Formats that write several files are selected whole, so "index.ja.html" builds every language's page.
+    """
+
+    patterns = list(patterns)
+    unmatched = [
+        pattern for pattern in patterns
+        if not any(
+            fnmatch.fnmatch(filename, pattern) for output_format in output_formats for filename in output_format.filenames
+        )
+    ]
+
+    if unmatched:
+        raise KeyError(
+            f"No output format matches {', '.join(map(repr, unmatched))}, "
+            f"the formats are: {', '.join(filename for output_format in output_formats for filename in output_format.filenames)}"
+        )
+
+    return [
+        output_format for output_format in output_formats
+        if any(fnmatch.fnmatch(filename, pattern) for filename in output_format.filenames for pattern in patterns)
+    ]
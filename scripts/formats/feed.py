@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+Delta feed - the upcoming events as a versioned feed, so clients that already have a version only fetch what changed
+
+Files, all under feed/:
+- version.json: the current version, and the oldest version that can still catch up with deltas. This is all a
+   client needs to poll.
+- latest.json: every upcoming event at the current version.
+- delta.<N>.json: what was added, changed and removed between versions N - 1 and N.
+
+A client at version `v` fetches delta.<v + 1>.json up to the current version if `v` is at least the oldest version
+that can catch up, and latest.json otherwise (including if the version went backwards, i.e. the feed was reset).
+"""
+
+import json
+import typing
+
+import reporting
+from definitions import ScheduleSnapshot, event_id
+from output import OutputWriter
+
+
+FEED_FOLDER = "feed"
+VERSION_FILENAME = f"{FEED_FOLDER}/version.json"
+LATEST_FILENAME = f"{FEED_FOLDER}/latest.json"
+
+# How many versions back clients can catch up from with deltas, older deltas are deleted
+DELTA_HISTORY = 64
+
+
+class FeedEvent(typing.TypedDict):
+    id: int
+    lane: str
+    language: str | None
+    event_name: str
+    presenter: str
+    timestamp: int
+    root_timezone: str
+
+
+def delta_filename(version: int) -> str:
+    return f"{FEED_FOLDER}/delta.{version}.json"
+
+
+def feed_events(snapshot: ScheduleSnapshot) -> dict[int, FeedEvent]:
+    # Nothing that changes every build (like time until) goes in here, or every event would change every build
+    return {
+        event_id(event_lane, event): {
+            "id": event_id(event_lane, event),
+            "lane": event_lane.name,
+            "language": event_lane.meta.get('language_info', {}).get('abbreviation', None),
+            "event_name": event.name,
+            "presenter": event.host,
+            "timestamp": int(next_occurrence.timestamp() * 1000),
+            "root_timezone": event.timezone,
+        }
+        for next_occurrence, event_lane, event in snapshot.upcoming()
+    }
+
+
+def read_previous_feed(output_writer: OutputWriter) -> tuple[int, dict[int, FeedEvent]]:
+    path = output_writer.folder / LATEST_FILENAME
+
+    if not path.exists():
+        return 0, {}
+
+    try:
+        with open(path, 'r', encoding='utf-8') as fp:
+            latest = json.load(fp)
+
+        return latest["version"], {feed_event["id"]: feed_event for feed_event in latest["events"]}
+    except (OSError, ValueError, KeyError, TypeError) as exception:
+        # Starting over is safe, clients see the version go backwards and fetch latest.json
+        reporting.warn(f"Warning: could not read the previous feed ({exception}), starting it over")
+        return 0, {}
+
+
+def write_json(output_writer: OutputWriter, name: str, content: typing.Any):
+    with output_writer.open(name) as stream:
+        stream.write(json.dumps(content, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def generate_feed(snapshot: ScheduleSnapshot, output_writer: OutputWriter) -> list[str]:
+    """
+    Writes the feed, moving it on a version (with a delta) if any event changed, returning the names of the files
+    written.
+    """
+
+    previous_version, previous_events = read_previous_feed(output_writer)
+    events = feed_events(snapshot)
+    version = previous_version
+    names = []
+
+    delta = {
+        "added": [feed_event for event_id, feed_event in events.items() if event_id not in previous_events],
+        "changed": [
+            feed_event for event_id, feed_event in events.items()
+            if event_id in previous_events and previous_events[event_id] != feed_event
+        ],
+        "removed": [event_id for event_id in previous_events if event_id not in events],
+    }
+
+    if version == 0 or any(delta.values()):
+        version += 1
+
+        # The first version has nothing to be a delta from
+        if version > 1:
+            write_json(output_writer, delta_filename(version), {"from": previous_version, "version": version, **delta})
+            names.append(delta_filename(version))
+
+        (output_writer.folder / delta_filename(version - DELTA_HISTORY)).unlink(missing_ok=True)
+
+    oldest = max(version - DELTA_HISTORY, 1)
+
+    write_json(output_writer, LATEST_FILENAME, {"version": version, "events": list(events.values())})
+    write_json(output_writer, VERSION_FILENAME, {"version": version, "oldest": oldest})
+
+    return names + [LATEST_FILENAME, VERSION_FILENAME]
@@ -4,70 +4,124 @@
 HTML format, for GitHub Pages
 """
 
-import datetime
+import contextlib
+import functools
+import itertools
 import pathlib
 import typing
-from zoneinfo import ZoneInfo
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
-from definitions import EventLane
+from definitions import EventLane, EventLaneEvent, ScheduleSnapshot
+from formats.localization import LANGUAGES, LOCALIZATIONS, Localization
+from formats.timezones import DISPLAY_TIMEZONES, LocalizedTime, localize
+from output import OutputWriter
+from transitions import TransitionTable
 
 
 
 THIS_FILE = pathlib.Path(__file__)
 TEMPLATES_DIRECTORY = THIS_FILE.parent.parent / "templates"
 
-JINJA_ENVIRONMENT = Environment(loader=FileSystemLoader(TEMPLATES_DIRECTORY))
-
-DISPLAY_TIMEZONES = [ZoneInfo(iana) for iana in [
-    "America/Los_Angeles",
-    "America/Chicago",
-    "America/New_York",
-    "Europe/London",
-    "Europe/Paris",
-    "Australia/Perth",
-    "Asia/Tokyo",
-]]
-
-WEEKNAMES_EN = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-WEEKNAMES_JA = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
-
-WEEKNAMES = {"en": WEEKNAMES_EN, "ja": WEEKNAMES_JA}
-
-
-def generate_html(event_lanes: list[EventLane], language: str = "en") -> str:
-    now = datetime.datetime.now(datetime.UTC)
-    manifest: typing.List[typing.Tuple[typing.Dict[str, typing.Any], int]] = []
-
-    template = JINJA_ENVIRONMENT.get_template(f"html_template.{language}.jinja2")
-
-    for event_lane in event_lanes:
-        for event in event_lane.events:
-            next_occurrence = event.next_occurrence_after(now)
-
-            if next_occurrence is None:
-                continue
-
-            manifest.append(({
-                "event_name": event.name,
-                "event_lane": event_lane.name,
-                "line_number": event.defined_line,
-                "presenter": event.host,
-                "root_timezone": event.timezone,
-                "timezones": [
-                    f"{WEEKNAMES[language][next_occurrence.astimezone(tz).weekday()]} {next_occurrence.astimezone(tz).strftime('%H:%M')} {next_occurrence.astimezone(tz).tzname()}"
-                    for tz in DISPLAY_TIMEZONES
-                ],
-            }, int((next_occurrence - now).total_seconds() * 1000)))
-
-
-    manifest.sort(key=lambda pair: pair[1])
-
-    from formats.all import OUTPUT_FORMATS
-
-    return template.render(
-        manifest=[event[0] for event in manifest],
-        generation_time=now.isoformat(),
-        output_formats=OUTPUT_FORMATS,
-    ) + "\n"
+# Compiled templates are kept with the lane cache, so a build only compiles templates that changed since the last one
+BYTECODE_CACHE_FOLDER = THIS_FILE.parent.parent.parent / ".cache" / "jinja"
+
+
+class PageRow(typing.NamedTuple):
+    event_lane: EventLane
+    event: EventLaneEvent
+    local_times: list[LocalizedTime]
+    # Zones it's at a different time than usual in, as clocks changed there and in its own zone at different times
+    time_shift: list[str]
+
+
+@functools.lru_cache(maxsize=None)
+def jinja_environment() -> Environment:
+    bytecode_cache = None
+
+    # The cache is only an optimization, so go without it if it can't be written
+    try:
+        BYTECODE_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(BYTECODE_CACHE_FOLDER)
+    except OSError:
+        pass
+
+    # Templates are still checked for changes on each load, so a resident build picks up edits
+    return Environment(loader=FileSystemLoader(TEMPLATES_DIRECTORY), bytecode_cache=bytecode_cache)
+
+
+def render_pages(
+    snapshot: ScheduleSnapshot,
+    transitions: TransitionTable,
+    output_filenames: list[str],
+    languages: typing.Sequence[str] = LANGUAGES,
+) -> list[typing.Iterator[str]]:
+    """
+    Lazily renders the page for each of `languages` a chunk at a time, from one pass over the upcoming events.
+
+    Each event is converted into the display zones (and checked for clock changes) once, and each page only words it
+    in its own language. The pages share the pass, so they should be read in step (as `generate_html` does) for it to
+    stay a few events ahead of the slowest page rather than buffering all of them.
+    """
+
+    environment = jinja_environment()
+
+    def rows() -> typing.Iterator[PageRow]:
+        for next_occurrence, event_lane, event in snapshot.upcoming():
+            local_times = [localize(next_occurrence, tz) for tz in DISPLAY_TIMEZONES]
+            shifted_zones = set(transitions.shifted_zones(event, next_occurrence, DISPLAY_TIMEZONES))
+
+            yield PageRow(event_lane, event, local_times, [
+                local_time.tzname for tz, local_time in zip(DISPLAY_TIMEZONES, local_times) if tz in shifted_zones
+            ])
+
+    def render(localization: Localization, language_rows: typing.Iterator[PageRow]) -> typing.Iterator[str]:
+        # Rows are only built as the templates reach them, so the pages are never held in memory as a whole
+        manifest = (
+            {
+                "event_name": row.event.name,
+                "event_lane": row.event_lane.name,
+                "line_number": row.event.defined_line,
+                "presenter": row.event.host,
+                "root_timezone": row.event.timezone,
+                "timezones": list(map(localization.local_time, row.local_times)),
+                "time_shift": row.time_shift,
+            }
+            for row in language_rows
+        )
+
+        yield from environment.get_template(localization.html_template).generate(
+            manifest=manifest,
+            generation_time=snapshot.now.isoformat(),
+            output_filenames=output_filenames,
+        )
+        yield "\n"
+
+    return [
+        render(LOCALIZATIONS[language], language_rows)
+        for language, language_rows in zip(languages, itertools.tee(rows(), len(languages)))
+    ]
+
+
+def generate_html(
+    snapshot: ScheduleSnapshot,
+    transitions: TransitionTable,
+    output_writer: OutputWriter,
+    output_filenames: list[str],
+    languages: typing.Sequence[str] = LANGUAGES,
+) -> list[str]:
+    """
+    Streams the page for each of `languages` straight to its file, returning the names of the files written.
+    """
+
+    localizations = [LOCALIZATIONS[language] for language in languages]
+
+    with contextlib.ExitStack() as stack:
+        streams = [stack.enter_context(output_writer.open(localization.html_filename)) for localization in localizations]
+
+        # A chunk of each page in turn, so the pages move through the events together
+        for chunks in itertools.zip_longest(*render_pages(snapshot, transitions, output_filenames, languages), fillvalue=""):
+            for stream, chunk in zip(streams, chunks):
+                stream.write(chunk)
+
+    return [localization.html_filename for localization in localizations]
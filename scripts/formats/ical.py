@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+
+"""
+iCalendar format - one feed per lane plus a global one, for calendar apps to subscribe to
+"""
+
+import contextlib
+import dataclasses
+import datetime
+import functools
+import hashlib
+import math
+import typing
+from zoneinfo import ZoneInfo
+
+from definitions import EventLane, EventLaneEvent, ScheduleSnapshot, event_identity
+from output import HashingStream, OutputWriter
+from transitions import find_transitions, offset_at
+
+
+CALENDAR_FOLDER = "calendar"
+GLOBAL_CALENDAR_FILENAME = f"{CALENDAR_FOLDER}/all.ics"
+
+PRODUCT_ID = "-//Helping Hands//Schedule//EN"
+
+# Content lines longer than this many octets have to be folded
+MAX_LINE_OCTETS = 75
+
+# Zones' offset changes are read up to here, and each zone is assumed to keep following its last yearly rule after
+#  it (tzdata lists changes explicitly up to 2037, and repeats each zone's last rule from then on anyway)
+RULES_UNTIL = datetime.datetime(2038, 1, 1, tzinfo=datetime.UTC)
+
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+# RRULE intervals have to be whole numbers, so events that repeat every fractional number of days are listed
+#  occurrence by occurrence instead, this far ahead of the build
+EXPANSION_HORIZON = datetime.timedelta(weeks=26)
+
+
+def escape_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def fold_line(line: str) -> str:
+    # Folded lines continue with a single leading space, and mustn't be split in the middle of a UTF-8 sequence
+    if len(line.encode('utf-8')) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+
+    parts = []
+    current = ""
+    limit = MAX_LINE_OCTETS
+
+    for character in line:
+        if len((current + character).encode('utf-8')) > limit:
+            parts.append(current)
+            current = ""
+            # Continuation lines lose an octet to the leading space
+            limit = MAX_LINE_OCTETS - 1
+
+        current += character
+
+    parts.append(current)
+
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_local(when: datetime.datetime) -> str:
+    return f"{when:%Y%m%dT%H%M%S}"
+
+
+def format_utc(when: datetime.datetime) -> str:
+    return f"{when.astimezone(datetime.UTC):%Y%m%dT%H%M%SZ}"
+
+
+def event_uid(event_lane: EventLane, event: EventLaneEvent) -> str:
+    return f"{hashlib.sha256(event_identity(event_lane, event)).hexdigest()[:32]}@schedule.helpinghands"
+
+
+def format_duration(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return "PT" + (f"{hours}H" if hours else "") + (f"{minutes}M" if minutes else "")
+
+
+def repeats_daily(event: EventLaneEvent) -> bool:
+    # Intervals are numbers in the templates, so can be fractional (or whole, but read as floats)
+    return float(event.interval).is_integer()
+
+
+def recurrence_rule(event: EventLaneEvent, last: datetime.datetime | None) -> str:
+    interval = int(event.interval)
+
+    # Whole weeks read better (and are what calendar apps offer in their UI), anything else repeats every n days
+    if interval % 7 == 0:
+        rule = f"FREQ=WEEKLY;INTERVAL={interval // 7}"
+    else:
+        rule = f"FREQ=DAILY;INTERVAL={interval}"
+
+    if last is not None:
+        # UNTIL has to be in UTC when DTSTART has a time zone
+        rule += f";UNTIL={format_utc(last)}"
+
+    return rule
+
+
+def format_offset(offset: datetime.timedelta) -> str:
+    seconds = int(offset.total_seconds())
+    hours, remainder = divmod(abs(seconds), 60 * 60)
+    minutes, seconds = divmod(remainder, 60)
+
+    return ("-" if offset < datetime.timedelta(0) else "+") + f"{hours:02d}{minutes:02d}" + (f"{seconds:02d}" if seconds else "")
+
+
+def weekday_rules(day: datetime.date) -> set[str]:
+    # The BYDAY values that pick `day` out of its month: which of its weekday it is, and whether it's the last one
+    weekday = WEEKDAY_CODES[day.weekday()]
+    rules = set()
+
+    if day.day <= 28:
+        rules.add(f"{(day.day - 1) // 7 + 1}{weekday}")
+
+    if (day + datetime.timedelta(days=7)).month != day.month:
+        rules.add(f"-1{weekday}")
+
+    return rules
+
+
+@dataclasses.dataclass
+class ObservanceRun:
+    """
+    Consecutive years in which a zone changed its offset in the same way, on the same weekday of the same month,
+    which a single yearly recurring observance describes.
+    """
+
+    kind: str
+    before: datetime.timedelta
+    after: datetime.timedelta
+    tzname: str
+    # Local wall-clock times (at the offset before) that the changes happened at, and the instants they happened
+    onsets: list[datetime.datetime]
+    instants: list[datetime.datetime]
+    # BYDAY values that match every year so far
+    rules: set[str]
+
+    def lines(self, continues: bool) -> typing.Iterator[str]:
+        yield f"BEGIN:{self.kind}"
+        yield f"DTSTART:{format_local(self.onsets[0])}"
+        yield f"TZOFFSETFROM:{format_offset(self.before)}"
+        yield f"TZOFFSETTO:{format_offset(self.after)}"
+        yield f"TZNAME:{escape_text(self.tzname)}"
+
+        if continues or len(self.onsets) > 1:
+            rule = f"FREQ=YEARLY;BYMONTH={self.onsets[0].month};BYDAY={min(self.rules)}"
+
+            if not continues:
+                rule += f";UNTIL={format_utc(self.instants[-1])}"
+
+            yield f"RRULE:{rule}"
+
+        yield f"END:{self.kind}"
+
+
+@functools.lru_cache(maxsize=None)
+def timezone_lines(timezone: str, start: datetime.datetime) -> tuple[str, ...]:
+    """
+    A VTIMEZONE for `timezone` from `start` on, built from its offset changes up to RULES_UNTIL.
+
+    Changes that repeat yearly become recurring observances, and the ones still repeating at RULES_UNTIL carry on
+    without an end. Anything irregular comes out as one observance per change.
+    """
+
+    zone = ZoneInfo(timezone)
+    initial = offset_at(zone, start)
+    runs: list[ObservanceRun] = []
+    open_runs: dict[tuple, ObservanceRun] = {}
+
+    # Whatever was in effect at the start, so nothing in the feed falls before every observance
+    runs.append(ObservanceRun(
+        "STANDARD", initial, initial, start.astimezone(zone).tzname(), [(start + initial).replace(tzinfo=None)], [start], set(),
+    ))
+
+    for transition in find_transitions(zone, start, RULES_UNTIL):
+        if transition.when >= RULES_UNTIL:
+            break
+
+        onset = (transition.when + transition.before).replace(tzinfo=None)
+        tzname = transition.when.astimezone(zone).tzname()
+        # Going by the direction of the change rather than dst(), as some zones (e.g. Europe/Dublin) count winter as
+        #  their daylight saving time
+        kind = "DAYLIGHT" if transition.after > transition.before else "STANDARD"
+        key = (kind, transition.before, transition.after, tzname, onset.month, onset.time())
+        rules = weekday_rules(onset.date())
+        run = open_runs.get(key, None)
+
+        if run is not None and run.onsets[-1].year == onset.year - 1 and run.rules & rules:
+            run.onsets.append(onset)
+            run.instants.append(transition.when)
+            run.rules &= rules
+        else:
+            run = open_runs[key] = ObservanceRun(kind, transition.before, transition.after, tzname, [onset], [transition.when], rules)
+            runs.append(run)
+
+    lines = ["BEGIN:VTIMEZONE", f"TZID:{timezone}"]
+
+    for index, run in enumerate(runs):
+        continues = index > 0 and len(run.onsets) > 1 and run.instants[-1].year == RULES_UNTIL.year - 1
+        lines.extend(run.lines(continues))
+
+    lines.append("END:VTIMEZONE")
+
+    return tuple(lines)
+
+
+def first_occurrence(event: EventLaneEvent) -> datetime.datetime:
+    # The first occurrence on or after not_before (if any), which first_occurrence_index already skips to
+    return event.occurrence_at(event.first_occurrence_index(event.basis))
+
+
+def has_occurrences(event: EventLaneEvent) -> bool:
+    return not event.paused and not (event.not_after and first_occurrence(event).date() > event.not_after)
+
+
+def event_lines(event_lane: EventLane, event: EventLaneEvent, expand_until: datetime.datetime) -> list[str]:
+    """
+    The event's VEVENT lines, except for DTSTAMP (see `stamp_event`), or nothing if it has no occurrences.
+
+    Events that don't repeat every whole number of days have their occurrences up to `expand_until` listed.
+    """
+
+    if not has_occurrences(event):
+        return []
+
+    zone = ZoneInfo(event.timezone)
+    first = first_occurrence(event)
+
+    if repeats_daily(event):
+        last = None
+
+        if event.not_after:
+            last = event.occurrence_at(math.floor((event.not_after - event.basis.date()).days / event.interval))
+
+        recurrence = [f"RRULE:{recurrence_rule(event, last)}"]
+    else:
+        # At least the first, even if it's past `expand_until`
+        end = max(expand_until, first + datetime.timedelta(days=event.interval))
+        _, *rest = event.occurrences_between(first, end)
+        recurrence = []
+
+        if rest:
+            recurrence.append(f"RDATE;TZID={event.timezone}:" + ",".join(format_local(when.astimezone(zone)) for when in rest))
+
+    language_info = event_lane.meta.get('language_info', None)
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{event_uid(event_lane, event)}",
+        # The recurrence keeps the same local time across DST changes. The zone is defined in the feed's VTIMEZONEs
+        f"DTSTART;TZID={event.timezone}:{format_local(first.astimezone(zone))}",
+        f"DURATION:{format_duration(event.duration)}",
+        *recurrence,
+        f"SUMMARY:{escape_text(event.name)}",
+        f"DESCRIPTION:{escape_text(f'{event.name} with {event.host}')}",
+    ]
+
+    if language_info is not None:
+        lines.append(f"CATEGORIES:{escape_text(language_info['abbreviation'])}")
+
+    lines.append("END:VEVENT")
+
+    return lines
+
+
+def read_previous_stamps(output_writer: OutputWriter) -> dict[str, tuple[str, list[str]]]:
+    """
+    UID -> DTSTAMP and the rest of the event's lines, from the last build's global feed (if there is one).
+    """
+
+    path = output_writer.folder / GLOBAL_CALENDAR_FILENAME
+
+    try:
+        # Read as bytes, as reading as text would turn the CRLFs the lines are split on into LFs
+        content = path.read_bytes().decode('utf-8')
+    except (OSError, ValueError):
+        return {}
+
+    stamps: dict[str, tuple[str, list[str]]] = {}
+    current: list[str] | None = None
+    stamp = None
+
+    for line in content.replace("\r\n ", "").split("\r\n"):
+        if line == "BEGIN:VEVENT":
+            current, stamp = [line], None
+        elif current is None:
+            continue
+        elif line.startswith("DTSTAMP:"):
+            stamp = line.removeprefix("DTSTAMP:")
+        else:
+            current.append(line)
+
+            if line == "END:VEVENT":
+                if stamp is not None and len(current) > 1 and current[1].startswith("UID:"):
+                    stamps[current[1].removeprefix("UID:")] = (stamp, current)
+
+                current = None
+
+    return stamps
+
+
+def stamp_event(lines: list[str], previous_stamps: dict[str, tuple[str, list[str]]], now: datetime.datetime) -> list[str]:
+    # DTSTAMP is when the event last changed: kept from the last build if nothing else about it has changed since,
+    #  so an unchanged schedule gives unchanged feeds, and otherwise now
+    stamp, previous_lines = previous_stamps.get(lines[1].removeprefix("UID:"), (None, None))
+
+    if previous_lines != lines:
+        stamp = format_utc(now)
+
+    return [*lines[:2], f"DTSTAMP:{stamp}", *lines[2:]]
+
+
+@contextlib.contextmanager
+def write_calendar(stream: HashingStream, name: str, timezones: typing.Iterable[tuple[str, ...]]) -> typing.Iterator[HashingStream]:
+    """
+    Writes a feed's header and zones, then its events as they're written to the stream, then its footer.
+    """
+
+    for line in ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODUCT_ID}", "CALSCALE:GREGORIAN", f"X-WR-CALNAME:{escape_text(name)}"]:
+        stream.write(fold_line(line))
+
+    for lines in timezones:
+        for line in lines:
+            stream.write(fold_line(line))
+
+    yield stream
+
+    stream.write(fold_line("END:VCALENDAR"))
+
+
+def lane_calendar_name(event_lane: EventLane) -> str:
+    language_info = event_lane.meta.get('language_info', None)
+
+    if language_info is None:
+        return f"Helping Hands ({event_lane.name})"
+
+    return f"Helping Hands ({language_info['localized_name'].get('en', language_info['abbreviation'])})"
+
+
+def generate_ical(snapshot: ScheduleSnapshot, output_writer: OutputWriter) -> list[str]:
+    """
+    Writes each lane's feed and the global feed, returning the names of the files written.
+
+    Each event is rendered once, as its lane's feed is written, and goes into the global feed at the same time, so
+    only one event is ever held in memory.
+    """
+
+    previous_stamps = read_previous_stamps(output_writer)
+    expand_until = snapshot.now + EXPANSION_HORIZON
+
+    # Every zone's VTIMEZONE starts from the year before the earliest event, so the same one goes in every feed
+    firsts = [first_occurrence(event) for event_lane in snapshot.event_lanes for event in event_lane.events if not event.paused]
+    start = datetime.datetime(min(firsts, default=snapshot.now).year - 1, 1, 1, tzinfo=datetime.UTC)
+
+    def timezones(event_lanes: list[EventLane]) -> list[tuple[str, ...]]:
+        used = {event.timezone for event_lane in event_lanes for event in event_lane.events if has_occurrences(event)}
+        return [timezone_lines(timezone, start) for timezone in sorted(used)]
+
+    names = []
+
+    with (
+        output_writer.open(GLOBAL_CALENDAR_FILENAME) as global_stream,
+        write_calendar(global_stream, "Helping Hands", timezones(snapshot.event_lanes)),
+    ):
+        for event_lane in snapshot.event_lanes:
+            name = f"{CALENDAR_FOLDER}/{event_lane.name}.ics"
+
+            with output_writer.open(name) as stream, write_calendar(stream, lane_calendar_name(event_lane), timezones([event_lane])):
+                for event in event_lane.events:
+                    if lines := event_lines(event_lane, event, expand_until):
+                        rendered = "".join(map(fold_line, stamp_event(lines, previous_stamps, snapshot.now)))
+                        stream.write(rendered)
+                        global_stream.write(rendered)
+
+            names.append(name)
+
+    names.append(GLOBAL_CALENDAR_FILENAME)
+
+    return names
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-language strings for the formats that are written once per language (HTML and TextMeshPro)
+
+Adding a language is a matter of adding its entry here (and its HTML template), every format that's written per
+language picks it up.
+"""
+
+import typing
+
+from formats.timezones import LocalizedTime
+
+
+class Localization(typing.NamedTuple):
+    # Monday first, as with datetime.weekday()
+    weeknames: list[str]
+    # In scripts/templates
+    html_template: str
+    html_filename: str
+    textmeshpro_header: str
+    textmeshpro_event: str
+    # Shown under an event that's at a different time than usual in some zones, as clocks changed there and in its
+    #  own zone at different times
+    textmeshpro_time_shift: str
+    textmeshpro_filename: str
+
+    def local_time(self, local_time: LocalizedTime) -> str:
+        return f"{self.weeknames[local_time.weekday]} {local_time.clock_24} {local_time.tzname}"
+
+
+LOCALIZATIONS: dict[str, Localization] = {
+    "en": Localization(
+        weeknames=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+        html_template="html_template.en.jinja2",
+        html_filename="index.html",
+        textmeshpro_header="""
+<align=center><size=125%>Helping Hands Schedule</size></align>
+""".strip(),
+        textmeshpro_event="""
+<b>{event_name}</b> <size=70%>with {presenter}</size><size=60%>
+{timezones}
+</size>
+""".strip(),
+        textmeshpro_time_shift="<color=#FFCC00>Clocks have changed, different time than usual in {zones}</color>",
+        textmeshpro_filename="textmeshpro.en.txt",
+    ),
+    "ja": Localization(
+        weeknames=["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"],
+        html_template="html_template.ja.jinja2",
+        html_filename="index.ja.html",
+        textmeshpro_header="""
+<align=center><size=125%>Helping Hands スケジュール</size></align>
+""".strip(),
+        textmeshpro_event="""
+<b>{event_name}</b> <size=70%>担当者 {presenter}</size><size=60%>
+{timezones}
+</size>
+""".strip(),
+        textmeshpro_time_shift="<color=#FFCC00>時計の切り替えにより、{zones} ではいつもと異なる時間</color>",
+        textmeshpro_filename="textmeshpro.ja.txt",
+    ),
+}
+
+LANGUAGES = list(LOCALIZATIONS)
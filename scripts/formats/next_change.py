@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+"""
+Next change - when the outputs will next come out differently, so the next build can be scheduled for then
+"""
+
+import datetime
+
+from definitions import ScheduleSnapshot
+
+
+def generate_next_change(snapshot: ScheduleSnapshot) -> dict:
+    change = snapshot.next_change()
+
+    if change is None:
+        return {"when": None, "timestamp": None, "reason": None}
+
+    return {
+        "when": change.when.astimezone(datetime.UTC).isoformat(),
+        "timestamp": str(int(change.when.timestamp() * 1000)),
+        "reason": change.reason,
+    }
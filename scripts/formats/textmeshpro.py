@@ -4,82 +4,64 @@
 TextMeshPro format, for direct loading in VRChat
 """
 
-import datetime
+import contextlib
 import textwrap
 import typing
-from zoneinfo import ZoneInfo
 
-from definitions import EventLane
+from definitions import ScheduleSnapshot
+from formats.localization import LANGUAGES, LOCALIZATIONS
+from formats.timezones import DISPLAY_TIMEZONES, DISPLAY_TIMEZONES_SPECIAL, localize
+from output import OutputWriter
+from transitions import TransitionTable
 
 
-DISPLAY_TIMEZONES = [ZoneInfo(iana) for iana in [
-    "America/Los_Angeles",
-    "America/Chicago",
-    "America/New_York",
-    "Europe/London",
-    "Europe/Paris",
-    "Australia/Perth",
-    "Asia/Tokyo",
-]]
+# Shown under an event that's at a different time than usual in some zones, as clocks changed there and in its own
+#  zone at different times
+TIME_SHIFT_TEXT_SPECIAL = "<color=#FFCC00>時計の切り替え/Clocks have changed: {zones}</color>"
 
-HEADER_EN = """
-<align=center><size=125%>Helping Hands Schedule</size></align>
-""".strip()
-
-HEADER_JA = """
-<align=center><size=125%>Helping Hands スケジュール</size></align>
-""".strip()
-
-HEADERS = {"en": HEADER_EN, "ja": HEADER_JA}
-
-EVENT_TEXT_EN = """
-<b>{event_name}</b> <size=70%>with {presenter}</size><size=60%>
-{timezones}
-</size>
-""".strip()
-
-EVENT_TEXT_JA = """
-<b>{event_name}</b> <size=70%>担当者 {presenter}</size><size=60%>
-{timezones}
-</size>
-""".strip()
 
-EVENT_TEXTS = {"en": EVENT_TEXT_EN, "ja": EVENT_TEXT_JA}
+def time_shift_line(template: str, shifted_times: list[str]) -> list[str]:
+    return [template.format(zones=", ".join(shifted_times))] if shifted_times else []
 
-WEEKNAMES_EN = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-WEEKNAMES_JA = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
 
-WEEKNAMES = {"en": WEEKNAMES_EN, "ja": WEEKNAMES_JA}
+def generate_textmeshpro_text(
+    snapshot: ScheduleSnapshot,
+    transitions: TransitionTable,
+    output_writer: OutputWriter,
+    languages: typing.Sequence[str] = LANGUAGES,
+) -> list[str]:
+    """
+    Streams the schedule in each of `languages` to its own file, in one pass over the upcoming events, returning the
+    names of the files written.
+    """
 
+    localizations = [LOCALIZATIONS[language] for language in languages]
 
-def generate_textmeshpro_text(event_lanes: list[EventLane], language: str = "en") -> str:
-    now = datetime.datetime.now(datetime.UTC)
-    manifest: typing.List[typing.Tuple[str, int]] = []
+    with contextlib.ExitStack() as stack:
+        streams = [stack.enter_context(output_writer.open(localization.textmeshpro_filename)) for localization in localizations]
+        separator = "\n\n"
 
-    for event_lane in event_lanes:
-        for event in event_lane.events:
-            next_occurrence = event.next_occurrence_after(now)
+        for localization, stream in zip(localizations, streams):
+            stream.write(localization.textmeshpro_header + separator)
 
-            if next_occurrence is None:
-                continue
+        for position, (next_occurrence, _event_lane, event) in enumerate(snapshot.upcoming()):
+            # Converted (and checked for clock changes) once, only the wording differs between languages
+            local_times = [localize(next_occurrence, tz) for tz in DISPLAY_TIMEZONES]
+            shifted_zones = set(transitions.shifted_zones(event, next_occurrence, DISPLAY_TIMEZONES))
+            shifted_times = [local_time.tzname for tz, local_time in zip(DISPLAY_TIMEZONES, local_times) if tz in shifted_zones]
 
-            manifest.append((
-                EVENT_TEXTS[language].format(**{
+            for localization, stream in zip(localizations, streams):
+                stream.write((separator if position else "") + localization.textmeshpro_event.format(**{
                     "event_name": event.name,
                     "presenter": event.host,
                     "root_timezone": event.timezone,
-                    "timezones": textwrap.indent("\n".join(
-                        f"{WEEKNAMES[language][next_occurrence.astimezone(tz).weekday()]} {next_occurrence.astimezone(tz).strftime('%H:%M')} {next_occurrence.astimezone(tz).tzname()}"
-                        for tz in DISPLAY_TIMEZONES
-                    ), "        ")
-                }),
-                int((next_occurrence - now).total_seconds() * 1000)
-            ))
-
-
-    manifest.sort(key=lambda pair: pair[1])
+                    "timezones": textwrap.indent("\n".join([
+                        *map(localization.local_time, local_times),
+                        *time_shift_line(localization.textmeshpro_time_shift, shifted_times),
+                    ]), "        ")
+                }))
 
-    return HEADERS[language] + "\n\n" + "\n\n".join(pair[0] for pair in manifest)
+    return [localization.textmeshpro_filename for localization in localizations]
 
 
 HEADER_SPECIAL = """
@@ -90,55 +72,39 @@ HEADER_SPECIAL = """
 
 WEEKNAMES_SPECIAL = [chr(0xE000 + x) for x in range(7)]
 
-DISPLAY_TIMEZONES_SPECIAL = [(ZoneInfo(iana), alpha) for (iana, alpha) in [
-    ("America/Los_Angeles", ""),
-    ("America/Chicago", ""),
-    ("America/New_York", ""),
-    ("Europe/London", ""),
-    ("Europe/Paris", ""),
-    ("Australia/Perth", ""),
-    ("Asia/Tokyo", "\uE00A"),
-    ("Australia/Brisbane", ""),
-]]
-
 EVENT_TEXT_SPECIAL = """
 <size=120%>\uE00B</size> <b>{event_name}</b><pos=50%><size=70%>担当者/Presenter: </size> {presenter}</pos>
 {timezones}
 """.strip()
 
 
-def generate_textmeshpro_special(event_lanes: list[EventLane]) -> str:
-    now = datetime.datetime.now(datetime.UTC)
-    manifest: typing.List[typing.Tuple[str, int]] = []
-
-    for event_lane in event_lanes:
-        for event in event_lane.events:
-            next_occurrence = event.next_occurrence_after(now)
+def generate_textmeshpro_special(snapshot: ScheduleSnapshot, transitions: TransitionTable) -> str:
+    now = snapshot.now
+    manifest: list[str] = []
 
-            if next_occurrence is None:
-                continue
+    for next_occurrence, _event_lane, event in snapshot.upcoming():
+        local_times = [(localize(next_occurrence, tz), alpha) for (tz, alpha) in DISPLAY_TIMEZONES_SPECIAL]
 
-            timezones = [
-                f"{WEEKNAMES_SPECIAL[next_occurrence.astimezone(tz).weekday()]} {next_occurrence.astimezone(tz).strftime('%H:%M')} {next_occurrence.astimezone(tz).tzname()}  {alpha}"
-                for (tz, alpha) in DISPLAY_TIMEZONES_SPECIAL
-            ]
+        timezones = [
+            f"{WEEKNAMES_SPECIAL[local_time.weekday]} {local_time.clock_24} {local_time.tzname}  {alpha}"
+            for (local_time, alpha) in local_times
+        ]
 
-            paired_timezones = [
-                "            " + timezones[i] + " <pos=35%>" + timezones[i + int(len(timezones) / 2)] + "</pos>"
-                for i in range(0, int(len(timezones) / 2))
-            ]
-
-            manifest.append((
-                EVENT_TEXT_SPECIAL.format(**{
-                    "event_name": event.name,
-                    "presenter": event.host,
-                    "root_timezone": event.timezone,
-                    "timezones": "\n".join(paired_timezones)
-                }),
-                int((next_occurrence - now).total_seconds() * 1000)
-            ))
+        paired_timezones = [
+            "            " + timezones[i] + " <pos=35%>" + timezones[i + int(len(timezones) / 2)] + "</pos>"
+            for i in range(0, int(len(timezones) / 2))
+        ]
 
+        paired_timezones.extend("            " + line for line in time_shift_line(TIME_SHIFT_TEXT_SPECIAL, [
+            localize(next_occurrence, tz).tzname
+            for tz in transitions.shifted_zones(event, next_occurrence, [tz for (tz, _alpha) in DISPLAY_TIMEZONES_SPECIAL])
+        ]))
 
-    manifest.sort(key=lambda pair: pair[1])
+        manifest.append(EVENT_TEXT_SPECIAL.format(**{
+            "event_name": event.name,
+            "presenter": event.host,
+            "root_timezone": event.timezone,
+            "timezones": "\n".join(paired_timezones)
+        }))
 
-    return HEADER_SPECIAL.format(update_time=f"{now:%Y-%m-%d %H:%M} {now.tzname()}") + "\n\n" + "\n\n".join(pair[0] for pair in manifest)
+    return HEADER_SPECIAL.format(update_time=f"{now:%Y-%m-%d %H:%M} {now.tzname()}") + "\n\n" + "\n\n".join(manifest)
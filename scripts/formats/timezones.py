@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Display timezones shared by the output formats, plus a cache of occurrences rendered into them
+"""
+
+import datetime
+import functools
+import typing
+from zoneinfo import ZoneInfo
+
+
+# Used by the HTML and regular TextMeshPro formats
+DISPLAY_TIMEZONES = [ZoneInfo(iana) for iana in [
+    "America/Los_Angeles",
+    "America/Chicago",
+    "America/New_York",
+    "Europe/London",
+    "Europe/Paris",
+    "Australia/Perth",
+    "Asia/Tokyo",
+]]
+
+# Used by the 'special' TextMeshPro format, with the glyph to show next to each zone
+DISPLAY_TIMEZONES_SPECIAL = [(ZoneInfo(iana), alpha) for (iana, alpha) in [
+    ("America/Los_Angeles", ""),
+    ("America/Chicago", ""),
+    ("America/New_York", ""),
+    ("Europe/London", ""),
+    ("Europe/Paris", ""),
+    ("Australia/Perth", ""),
+    ("Asia/Tokyo", "\uE00A"),
+    ("Australia/Brisbane", ""),
+]]
+
+# Used by the 'old' format
+OLD_DISPLAY_TIMEZONES = [
+    {"alpha2": "US", "alpha3": "USA", "territory": "United States", "iana": "America/Los_Angeles"},
+    {"alpha2": "US", "alpha3": "USA", "territory": "United States", "iana": "America/Chicago"},
+    {"alpha2": "US", "alpha3": "USA", "territory": "United States", "iana": "America/New_York"},
+    {"alpha2": "GB", "alpha3": "GBR", "territory": "United Kingdom", "iana": "Europe/London"},
+    {"alpha2": "FR", "alpha3": "FRA", "territory": "France", "iana": "Europe/Paris"},
+    {"alpha2": "RU", "alpha3": "RUS", "territory": "Russia", "iana": "Europe/Moscow"},
+    {"alpha2": "AU", "alpha3": "AUS", "territory": "Australia", "iana": "Australia/Perth"},
+    {"alpha2": "KR", "alpha3": "KOR", "territory": "Republic of Korea", "iana": "Asia/Seoul"},
+]
+
+for OLD_TZ in OLD_DISPLAY_TIMEZONES:
+    OLD_TZ["tz"] = ZoneInfo(OLD_TZ["iana"])
+
+# Used by the webhook, with the country code to show as a flag
+TIMEZONE_PAIRS = (
+    ("US", ZoneInfo("Pacific/Honolulu")),
+    ("US", ZoneInfo("America/Los_Angeles")),
+    ("US", ZoneInfo("America/Chicago")),
+    ("US", ZoneInfo("America/New_York")),
+    ("UN", datetime.UTC),
+    ("GB", ZoneInfo("Europe/London")),
+    ("FR", ZoneInfo("Europe/Paris")),
+    ("AU", ZoneInfo("Australia/Sydney")),
+    ("KR", ZoneInfo("Asia/Seoul")),
+)
+
+
+class LocalizedTime(typing.NamedTuple):
+    weekday: int
+    day: int
+    weekday_name: str
+    weekday_short: str
+    clock_24: str
+    clock_12: str
+    tzname: str
+
+
+@functools.lru_cache(maxsize=65536)
+def localize(when: datetime.datetime, zone: datetime.tzinfo) -> LocalizedTime:
+    # Every format shows the same occurrences in mostly the same zones, so convert each pair once and
+    #  let the formats (in any language) assemble their strings from the parts.
+    local = when.astimezone(zone)
+
+    return LocalizedTime(
+        weekday=local.weekday(),
+        day=local.day,
+        weekday_name=local.strftime("%A"),
+        weekday_short=local.strftime("%a"),
+        clock_24=local.strftime("%H:%M"),
+        clock_12=local.strftime("%I:%M %p"),
+        tzname=local.tzname(),
+    )
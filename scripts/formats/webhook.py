@@ -6,15 +6,23 @@ Webhook, technically not a format, but allows us to send webhook messages
 
 import collections
 import datetime
-import itertools
+import functools
+import hashlib
+import json
 import typing
 from zoneinfo import ZoneInfo
 
 import discord
 
-from definitions import EventLane, EventLaneEvent
+import reporting
+from definitions import EventLaneEvent, ScheduleSnapshot
+from formats.timezones import TIMEZONE_PAIRS, localize
+from occurrences import OccurrenceIndex
+from publisher import WebhookJob, WebhookPublisher
+from transitions import TransitionTable
 
 
+@functools.lru_cache(maxsize=None)
 def calculate_notable_date_emojis(year: int) -> dict[tuple[int, int], str]:
     notable_date_emojis = {
         (1,  1):  "🎉",   # New Year's Day
@@ -72,18 +80,6 @@ CLOCK_EMOJIS: list[tuple[float, str]] = [
     (+13.5, "\N{CLOCK FACE ONE-THIRTY}"),
 ]
 
-TIMEZONE_PAIRS = (
-    ("US", ZoneInfo("Pacific/Honolulu")),
-    ("US", ZoneInfo("America/Los_Angeles")),
-    ("US", ZoneInfo("America/Chicago")),
-    ("US", ZoneInfo("America/New_York")),
-    ("UN", datetime.UTC),
-    ("GB", ZoneInfo("Europe/London")),
-    ("FR", ZoneInfo("Europe/Paris")),
-    ("AU", ZoneInfo("Australia/Sydney")),
-    ("KR", ZoneInfo("Asia/Seoul")),
-)
-
 DEFAULT_TAG_HEADING_EMOJI: str = "\N{INFORMATION SOURCE}"
 
 TAG_HEADING_EMOJIS: typing.Dict[str, str] = {
@@ -111,47 +107,103 @@ TAG_DESCRIPTIONS_EN: typing.Dict[str, str] = {
 }
 
 
+@functools.lru_cache(maxsize=None)
 def to_regionals(text: str):
     mapping = 0x1f1e6 - 0x61
 
     return ''.join(chr(ord(x) + mapping) for x in text.lower())
 
 
-def send_webhooks(event_lanes: list[EventLane]) -> dict:
-    lane_messages = {}
+def zone_flags(zones: typing.Iterable[datetime.tzinfo]) -> str:
+    # Zones sharing a country (e.g. US zones) only need its flag once
+    return " ".join(dict.fromkeys(to_regionals(flag) for flag, zone in TIMEZONE_PAIRS if zone in zones))
 
-    # Calculate for each event lane, as it changes how we calculate what counts as 'today'
-    for event_lane in event_lanes:
-        # Use New York time at 5am
-        event_lane_zone = ZoneInfo(event_lane.meta["default_timezone"])
-        now = datetime.datetime.now(event_lane_zone)
-        last_monday_5am = (now - datetime.timedelta(days=now.weekday())).replace(hour=5, minute=0, second=0, microsecond=0)
 
-        # If it's, for example, 4am on a Monday, we still don't consider the week turned over yet so use last week
-        if last_monday_5am > now:
-            last_monday_5am = last_monday_5am - datetime.timedelta(days=7)
+def fingerprint_embeds(embeds: list[dict[str, typing.Any]]) -> str:
+    return hashlib.sha256(json.dumps(embeds, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
 
-        next_monday_5am = last_monday_5am + datetime.timedelta(days=7)
 
-        events_by_day: dict[int, list[tuple[EventLaneEvent, datetime.datetime]]] = collections.defaultdict(list)
+@functools.lru_cache(maxsize=None)
+def day_title(day: datetime.date) -> str:
+    emoji = calculate_notable_date_emojis(day.year).get((day.month, day.day), "\N{SPIRAL CALENDAR PAD}")
+
+    return f"# {emoji} {day:%A (%Y-%m-%d)}"
+
+
+# An event's block only depends on the event, when it occurs and which day of the month it's listed under, so a lane
+#  that lists every lane's events (use_all_events) reuses the blocks the other lanes already rendered
+@functools.lru_cache(maxsize=4096)
+def event_block(
+    event: EventLaneEvent,
+    next_occurrence: datetime.datetime,
+    day_of_month: int,
+    shifted_flags: str = "",
+) -> str:
+    hour_time = (next_occurrence.hour + (next_occurrence.minute / 60)) % 12
+    emoji = min(CLOCK_EMOJIS, key=lambda pair: abs(pair[0] - hour_time))[1]
+
+    target_timezones = []
+
+    for flag, target_timezone in TIMEZONE_PAIRS:
+        as_target = localize(next_occurrence, target_timezone)
+        flag = to_regionals(flag)
 
-        if event_lane.meta.get('use_all_events', False):
-            events = list(itertools.chain(*[lane.events for lane in event_lanes]))
+        if as_target.day != day_of_month:
+            target_timezones.append(f'\u200b    {flag}  {as_target.clock_12} {as_target.tzname} ({as_target.weekday_short})')
         else:
-            events = event_lane.events
+            target_timezones.append(f'\u200b    {flag}  {as_target.clock_12} {as_target.tzname}')
 
-        for event in events:
-            next_occurrence = event.next_occurrence_after(last_monday_5am)
+    tags: typing.List[str] = []
+
+    for tag in event.tags:
+        tag_header, _tag_content = tag.split(":")
+
+        if tag in TAG_DESCRIPTIONS_EN and tag_header in TAG_HEADINGS_EN:
+            tags.append(f"{TAG_HEADING_EMOJIS.get(tag_header, DEFAULT_TAG_HEADING_EMOJI)} **{TAG_HEADINGS_EN[tag_header]}**: {TAG_DESCRIPTIONS_EN[tag]}")
+
+    tag_line = "-# " + " \N{KATAKANA MIDDLE DOT} ".join(tags) + "\n" if tags else ""
+
+    shift_line = ""
+
+    if shifted_flags:
+        shift_line = f"\n-# \N{WARNING SIGN} Clocks have changed, so this is at a different time than usual in {shifted_flags}"
+
+    return (
+        f"**{event.name}** with {event.host}\n"
+        f"{tag_line}"
+        f"\u200b    {emoji} {discord.utils.format_dt(next_occurrence, 'f')} ({discord.utils.format_dt(next_occurrence, 'R')})\n"
+        f"{'\n'.join(target_timezones)}"
+        f"{shift_line}"
+    )
+
+
+def send_webhooks(
+    snapshot: ScheduleSnapshot,
+    occurrence_index: OccurrenceIndex,
+    transitions: TransitionTable,
+    publisher: WebhookPublisher,
+    previous_messages: dict[str, typing.Any],
+) -> dict:
+    event_lanes = snapshot.event_lanes
+    lane_messages = {}
+    jobs: list[WebhookJob] = []
+    skipped = 0
+
+    # Calculate for each event lane, as it changes how we calculate what counts as 'today'
+    for event_lane in event_lanes:
+        event_lane_zone = ZoneInfo(event_lane.meta["default_timezone"])
+        last_monday_5am = event_lane.week_start(snapshot.now)
+        next_monday_5am = last_monday_5am + datetime.timedelta(days=7)
 
-            # If the event has no next occurrence then we don't care about it right now
-            if next_occurrence is None:
-                continue
+        events_by_day: dict[int, list[tuple[EventLaneEvent, datetime.datetime]]] = collections.defaultdict(list)
 
-            # If this event doesn't next occur within this week then we don't care about it right now
-            if next_occurrence < last_monday_5am or next_occurrence >= next_monday_5am:
-                continue
+        # Everything this week, in order, from every lane for the global lane or just this one otherwise
+        week_occurrences = occurrence_index.between(
+            last_monday_5am, next_monday_5am,
+            None if event_lane.meta.get('use_all_events', False) else [event_lane.name],
+        )
 
-            # Add the event and its next time to the list
+        for next_occurrence, _occurrence_lane, event in week_occurrences:
             events_by_day[next_occurrence.astimezone(event_lane_zone).weekday()].append((event, next_occurrence))
 
         # One embed for each day
@@ -166,62 +218,28 @@ def send_webhooks(event_lanes: list[EventLane]) -> dict:
                 description=header_text,
             ))
 
-        # Todo: add timezone shift warning
+        display_zones = [zone for _flag, zone in TIMEZONE_PAIRS]
 
         for weekday_offset in range(0, 7):
             # Calculate the day
             day = last_monday_5am + datetime.timedelta(days=weekday_offset)
 
-            # Sort the events in the list by their next occurrence
-            events_by_day[weekday_offset].sort(key=lambda pair: pair[1])
-
-            # Calculate notable date emojis
-            notable_date_emojis = calculate_notable_date_emojis(day.year)
-
-            emoji = notable_date_emojis.get((day.month, day.day), None)
-
-            if emoji is None:
-                title = f"# \N{SPIRAL CALENDAR PAD} {day:%A (%Y-%m-%d)}"
-            else:
-                title = f"# {emoji} {day:%A (%Y-%m-%d)}"
-
             description_parts = [
-                title,
+                day_title(day.date()),
+            ]
+
+            changing_zones = [
+                zone for zone in display_zones
+                if transitions.transitions_between(zone, day, day + datetime.timedelta(days=1))
             ]
 
+            if changing_zones:
+                description_parts.append(f"-# \N{WARNING SIGN} Clocks change today in {zone_flags(changing_zones)}")
 
             if events_by_day[weekday_offset]:
                 for (event, next_occurrence) in events_by_day[weekday_offset]:
-                    hour_time = (next_occurrence.hour + (next_occurrence.minute / 60)) % 12
-                    emoji = min(CLOCK_EMOJIS, key=lambda pair: abs(pair[0] - hour_time))[1]
-
-                    target_timezones = []
-
-                    for flag, target_timezone in TIMEZONE_PAIRS:
-                        as_target = next_occurrence.astimezone(target_timezone)
-                        flag = to_regionals(flag)
-
-                        if as_target.day != day.day:
-                            target_timezones.append(f'\u200b    {flag}  {as_target.strftime("%I:%M %p")} {as_target.tzname()} ({as_target.strftime("%a")})')
-                        else:
-                            target_timezones.append(f'\u200b    {flag}  {as_target.strftime("%I:%M %p")} {as_target.tzname()}')
-
-                    tags: typing.List[str] = []
-
-                    for tag in event.tags:
-                        tag_header, _tag_content = tag.split(":")
-
-                        if tag in TAG_DESCRIPTIONS_EN and tag_header in TAG_HEADINGS_EN:
-                            tags.append(f"{TAG_HEADING_EMOJIS.get(tag_header, DEFAULT_TAG_HEADING_EMOJI)} **{TAG_HEADINGS_EN[tag_header]}**: {TAG_DESCRIPTIONS_EN[tag]}")
-
-                    tag_line = "-# " + " \N{KATAKANA MIDDLE DOT} ".join(tags) + "\n" if tags else ""
-
-                    description_parts.append(
-                        f"**{event.name}** with {event.host}\n"
-                        f"{tag_line}"
-                        f"\u200b    {emoji} {discord.utils.format_dt(next_occurrence, 'f')} ({discord.utils.format_dt(next_occurrence, 'R')})\n"
-                        f"{'\n'.join(target_timezones)}"
-                    )
+                    shifted_flags = zone_flags(transitions.shifted_zones(event, next_occurrence, display_zones))
+                    description_parts.append(event_block(event, next_occurrence, day.day, shifted_flags))
             else:
                 description_parts.append("-# -- No events this day. --")
 
@@ -232,26 +250,42 @@ def send_webhooks(event_lanes: list[EventLane]) -> dict:
 
             weekday_embeds.append(embed)
 
-        # If a message exists update it
-        message: typing.Optional[discord.Message] = None
-        if event_lane.webhook:
-            if event_lane.webhook_message_id:
-                message = event_lane.webhook.edit_message(
-                    message_id=event_lane.webhook_message_id,
-                    embeds=weekday_embeds,
-                )
-            else:
-                message = event_lane.webhook.send(
-                    embeds=weekday_embeds,
-                    wait=True,
-                )
+        embeds = [embed.to_dict() for embed in weekday_embeds]
+        fingerprint = fingerprint_embeds(embeds)
 
         lane_messages[event_lane.name] = {
-            "message_id": message.id if message else None,
-            "embeds": [
-                embed.to_dict()
-                for embed in weekday_embeds
-            ]
+            "message_id": None,
+            "fingerprint": fingerprint,
+            "embeds": embeds,
         }
 
+        # If the message we'd edit already has exactly this content, don't spend an API call (or rate limit) on it
+        previous = previous_messages.get(event_lane.name, None) or {}
+        previous_fingerprint = previous.get("fingerprint", None) or fingerprint_embeds(previous.get("embeds", None) or [])
+
+        if (
+            event_lane.webhook_url
+            and event_lane.webhook_message_id
+            and previous.get("message_id", None) == event_lane.webhook_message_id
+            and previous_fingerprint == fingerprint
+        ):
+            lane_messages[event_lane.name]["message_id"] = event_lane.webhook_message_id
+            skipped += 1
+
+        # If a message exists it gets updated, otherwise a new one is sent
+        elif event_lane.webhook_url:
+            jobs.append(WebhookJob(
+                lane_name=event_lane.name,
+                url=event_lane.webhook_url,
+                message_id=event_lane.webhook_message_id,
+                payload={"embeds": embeds},
+            ))
+
+    if skipped:
+        reporting.echo(f"    Skipped {skipped} unchanged webhook edit(s)", fg='cyan')
+
+    # Publish every lane at once now that they're all rendered
+    for lane_name, message_id in publisher.publish(jobs).items():
+        lane_messages[lane_name]["message_id"] = message_id
+
     return lane_messages
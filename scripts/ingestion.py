@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reading event lane templates into events, with an on-disk cache of already converted lanes.
+"""
+
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
+import os
+import pathlib
+import pickle
+import sys
+import typing
+from zoneinfo import ZoneInfo
+
+import yaml
+from yaml import MappingNode
+
+# libyaml's parser is several times faster than the pure-Python one, but isn't available in every PyYAML install
+try:
+    from yaml import CSafeLoader as BaseSafeLoader
+except ImportError:
+    from yaml import SafeLoader as BaseSafeLoader
+
+from definitions import EventLaneEvent, EventLaneMeta, EventLaneRawEvent, EventLaneRawEvents
+import reporting
+from reporting import StageTimings
+
+if typing.TYPE_CHECKING:
+    import jsonschema
+
+
+SCRIPTS_FOLDER = pathlib.Path(__file__).parent
+SCHEMA_FOLDER = SCRIPTS_FOLDER.parent / 'schema'
+TEMPLATES_FOLDER = SCRIPTS_FOLDER.parent / 'templates'
+CACHE_FOLDER = SCRIPTS_FOLDER.parent / '.cache'
+
+META_SCHEMA_PATH = SCHEMA_FOLDER / 'template_meta.schema.json'
+EVENTS_SCHEMA_PATH = SCHEMA_FOLDER / 'template_events.schema.json'
+
+# Changing any of these changes what a lane converts to, so they all feed into the cache key
+CACHE_DEPENDENCIES = [
+    META_SCHEMA_PATH,
+    EVENTS_SCHEMA_PATH,
+    pathlib.Path(__file__),
+    SCRIPTS_FOLDER / 'definitions.py',
+]
+
+
+class LineNumberMixin:
+    def construct_mapping(self, node: MappingNode, deep: bool = False):
+        mapping = super().construct_mapping(node, deep=deep)
+        mapping['__line__'] = node.start_mark.line + 1
+        return mapping
+
+
+class SafeLineLoader(LineNumberMixin, BaseSafeLoader):
+    pass
+
+
+# Always the pure-Python parser, kept around for comparison
+class PureSafeLineLoader(LineNumberMixin, yaml.SafeLoader):
+    pass
+
+
+class TemplateValidationError(ValueError):
+    def __init__(self, event_lane_name: str, errors: list[str]):
+        self.event_lane_name = event_lane_name
+        self.errors = errors
+        # Passing both arguments up keeps it picklable, so it can come back from a pool worker
+        super().__init__(event_lane_name, errors)
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.errors)} problem(s) found in event lane `{self.event_lane_name}`:\n"
+            + "\n".join(f"  {error}" for error in self.errors)
+        )
+
+
+def nearest_line(instance: typing.Any, path: typing.Iterable[typing.Any]) -> int | None:
+    # Walk down to where the error is, remembering the deepest mapping that knew its line number
+    line = instance.get('__line__', None) if isinstance(instance, dict) else None
+
+    for part in path:
+        try:
+            instance = instance[part]
+        except (KeyError, IndexError, TypeError):
+            break
+
+        if isinstance(instance, dict):
+            line = instance.get('__line__', line)
+
+    return line
+
+
+def describe_errors(filename: str, validator: "jsonschema.protocols.Validator", instance: typing.Any) -> list[str]:
+    return [
+        f"{filename}:{nearest_line(instance, error.absolute_path) or '?'}: {error.message}"
+        + (f" (at {'/'.join(str(part) for part in error.absolute_path)})" if error.absolute_path else "")
+        for error in sorted(validator.iter_errors(instance), key=lambda error: list(map(str, error.absolute_path)))
+    ]
+
+
+class TemplateSchemas:
+    """
+    The template schemas, checked and compiled once so the same validators are reused for every lane.
+    """
+
+    def __init__(self, meta_schema: dict[str, typing.Any], events_schema: dict[str, typing.Any]):
+        # Imported here as it's slow to import and not needed at all when every lane comes from the cache
+        import jsonschema
+
+        meta_validator_class = jsonschema.validators.validator_for(meta_schema)
+        meta_validator_class.check_schema(meta_schema)
+        self.meta = meta_validator_class(meta_schema)
+
+        events_validator_class = jsonschema.validators.validator_for(events_schema)
+        events_validator_class.check_schema(events_schema)
+        # The events document is checked without its items, each event is then checked on its own as it's
+        #  decoded so errors can be attributed to (and collected for) every event in one pass
+        self.events_document = events_validator_class({
+            **events_schema,
+            "properties": {**events_schema["properties"], "events": {"type": "array"}},
+        })
+        self.event = events_validator_class({"$ref": "#/$defs/event", "$defs": events_schema["$defs"]})
+
+    def validate_meta(self, event_lane_name: str, meta_data: EventLaneMeta, timings: StageTimings | None = None):
+        timings = timings if timings is not None else StageTimings()
+
+        with timings.measure("validate"):
+            errors = describe_errors(f"{event_lane_name}/meta.yaml", self.meta, meta_data)
+
+        if errors:
+            raise TemplateValidationError(event_lane_name, errors)
+
+    def decode_events(
+        self,
+        event_lane_name: str,
+        meta_data: EventLaneMeta,
+        events_data: EventLaneRawEvents,
+        timings: StageTimings | None = None,
+    ) -> list[EventLaneEvent]:
+        timings = timings if timings is not None else StageTimings()
+        filename = f"{event_lane_name}/events.yaml"
+        errors = describe_errors(filename, self.events_document, events_data)
+        events: list[EventLaneEvent] = []
+
+        if errors:
+            raise TemplateValidationError(event_lane_name, errors)
+
+        for raw_event in events_data["events"]:
+            with timings.measure("validate", 1):
+                event_errors = describe_errors(filename, self.event, raw_event)
+
+            if not event_errors:
+                try:
+                    with timings.measure("convert", 1):
+                        events.append(convert_event(event_lane_name, meta_data, raw_event))
+                except (ValueError, LookupError) as exception:
+                    event_errors.append(f"{filename}:{raw_event.get('__line__', '?')}: {exception}")
+
+            errors.extend(event_errors)
+
+        if errors:
+            raise TemplateValidationError(event_lane_name, errors)
+
+        return events
+
+
+def convert_event(event_lane_name: str, meta_data: EventLaneMeta, raw_event: EventLaneRawEvent) -> EventLaneEvent:
+    schedule = raw_event["schedule"]
+    # Get timezone name
+    timezone = schedule.get("timezone", None) or meta_data["default_timezone"]
+    # Calculate basis datetime
+    basis = datetime.datetime \
+        .strptime(schedule["basis"], "%Y-%m-%d") \
+        .replace(
+            hour=schedule["hour"],
+            minute=schedule["minute"],
+            tzinfo=ZoneInfo(timezone)
+        )
+
+    # Check days line up
+    basis_day = basis.strftime("%A")
+    claimed_day = schedule["day"]
+
+    if basis_day != claimed_day:
+        raise ValueError(
+            f"Event '{raw_event['name']}' w/ {raw_event['host']} in `{event_lane_name}` has basis time of {basis:%a %d %b %Y, %I:%M%p} but claims it is a {claimed_day}"
+        )
+
+    # Hosts, tags and time zones repeat across a lane's events, interning them keeps one copy of each (which pickling
+    #  the lane for the cache preserves)
+    return EventLaneEvent(
+        defined_line=raw_event['__line__'],
+        host=sys.intern(raw_event['host']),
+        name=raw_event['name'],
+        tags=tuple(map(sys.intern, raw_event['tags'])),
+        paused=raw_event.get('paused', False),
+        basis=basis,
+        timezone=sys.intern(timezone),
+        interval=schedule.get('interval', None) or 7,
+        duration=schedule.get('duration', None) or 60,
+        not_before=datetime.datetime.strptime(schedule["not_before"], "%Y-%m-%d").date() if schedule.get("not_before", None) else None,
+        not_after=datetime.datetime.strptime(schedule["not_after"], "%Y-%m-%d").date() if schedule.get("not_after", None) else None,
+    )
+
+
+class CachedLane(typing.NamedTuple):
+    meta: EventLaneMeta
+    events: list[EventLaneEvent]
+
+
+class LaneCache:
+    """
+    Validated, converted lanes keyed by a hash of everything that went into them.
+
+    Any change to a lane's templates, either schema, or the conversion code itself produces a different key, so
+    stale entries are never used and are simply overwritten on the next miss.
+    """
+
+    def __init__(self, folder: pathlib.Path = CACHE_FOLDER / 'lanes', enabled: bool = True):
+        self.folder = folder
+        self.enabled = enabled
+
+        salt = hashlib.sha256()
+        for path in CACHE_DEPENDENCIES:
+            salt.update(path.read_bytes())
+        self.salt = salt.digest()
+
+    def key(self, *contents: bytes) -> str:
+        digest = hashlib.sha256(self.salt)
+
+        for content in contents:
+            # Length-prefix each part so moving bytes between files can't collide
+            digest.update(len(content).to_bytes(8, 'little'))
+            digest.update(content)
+
+        return digest.hexdigest()
+
+    def get(self, lane_name: str, key: str) -> CachedLane | None:
+        if not self.enabled:
+            return None
+
+        try:
+            with open(self.folder / f"{lane_name}.pickle", 'rb') as fp:
+                cached_key, lane = pickle.load(fp)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError, ImportError):
+            return None
+
+        return lane if cached_key == key else None
+
+    def put(self, lane_name: str, key: str, lane: CachedLane):
+        if not self.enabled:
+            return
+
+        temporary_path = self.folder / f"{lane_name}.pickle.tmp"
+
+        # The cache is only an optimization, so failing to write it shouldn't fail the build
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+
+            with open(temporary_path, 'wb') as fp:
+                pickle.dump((key, lane), fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+            temporary_path.replace(self.folder / f"{lane_name}.pickle")
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as exception:
+            # Pickling can fail part way through (e.g. an unpicklable value from a new YAML tag), so don't leave
+            #  a truncated file behind
+            with contextlib.suppress(OSError):
+                temporary_path.unlink(missing_ok=True)
+
+            reporting.warn(f"Warning: could not cache lane {lane_name}: {exception!r}")
+
+
+class IngestedLane(typing.NamedTuple):
+    name: str
+    meta: EventLaneMeta
+    events: list[EventLaneEvent]
+    cached: bool
+    timings: StageTimings
+
+
+# Below this many bytes of templates to parse, starting worker processes costs more than it saves
+PARALLEL_THRESHOLD = 256 * 1024
+
+
+def parse_lane(
+    event_lane_name: str,
+    meta_bytes: bytes,
+    events_bytes: bytes,
+    template_schemas: TemplateSchemas,
+    loader: type[yaml.SafeLoader] = SafeLineLoader,
+) -> tuple[CachedLane, StageTimings]:
+    timings = StageTimings()
+
+    with timings.measure("parse"):
+        meta_data: EventLaneMeta = yaml.load(meta_bytes, Loader=loader)
+
+    template_schemas.validate_meta(event_lane_name, meta_data, timings)
+
+    with timings.measure("parse"):
+        events_data: EventLaneRawEvents = yaml.load(events_bytes, Loader=loader)
+
+    events = template_schemas.decode_events(event_lane_name, meta_data, events_data, timings)
+
+    return CachedLane(meta_data, events), timings
+
+
+# Per-process state for pool workers, so schemas are compiled once per worker rather than once per lane
+WORKER_STATE: dict[str, typing.Any] = {}
+
+
+def initialize_worker(meta_schema: dict[str, typing.Any], events_schema: dict[str, typing.Any], cache_enabled: bool):
+    WORKER_STATE["template_schemas"] = TemplateSchemas(meta_schema, events_schema)
+    WORKER_STATE["lane_cache"] = LaneCache(enabled=cache_enabled)
+
+
+def parse_lane_in_worker(event_lane_name: str, meta_bytes: bytes, events_bytes: bytes, cache_key: str) -> tuple[CachedLane, StageTimings]:
+    lane, timings = parse_lane(event_lane_name, meta_bytes, events_bytes, WORKER_STATE["template_schemas"])
+    WORKER_STATE["lane_cache"].put(event_lane_name, cache_key, lane)
+    return lane, timings
+
+
+def ingest_lanes(
+    lane_folders: list[pathlib.Path],
+    meta_schema: dict[str, typing.Any],
+    events_schema: dict[str, typing.Any],
+    lane_cache: LaneCache,
+    jobs: int | None = None,
+    template_schemas: TemplateSchemas | None = None,
+) -> typing.Iterator[tuple[str, IngestedLane | None, BaseException | None]]:
+    """
+    Loads every lane, yielding `(lane name, lane, exception)` in the order the folders were given.
+
+    Lanes are independent, so when there's enough uncached template data to make it worthwhile they are parsed,
+    validated and converted on a process pool. Lanes parsed in this process use `template_schemas` if given, so a
+    long-running caller can compile the schemas once.
+    """
+
+    pending: list[tuple[str, bytes, bytes, str]] = []
+    results: dict[str, concurrent.futures.Future] = {}
+
+    for lane_folder in lane_folders:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        results[lane_folder.name] = future
+
+        try:
+            meta_bytes = (lane_folder / 'meta.yaml').read_bytes()
+            events_bytes = (lane_folder / 'events.yaml').read_bytes()
+        except OSError as exception:
+            future.set_exception(exception)
+            continue
+
+        timings = StageTimings()
+
+        with timings.measure("cache_lookup"):
+            cache_key = lane_cache.key(meta_bytes, events_bytes)
+            cached_lane = lane_cache.get(lane_folder.name, cache_key)
+
+        if cached_lane is not None:
+            future.set_result(IngestedLane(lane_folder.name, *cached_lane, cached=True, timings=timings))
+        else:
+            pending.append((lane_folder.name, meta_bytes, events_bytes, cache_key))
+
+    jobs = jobs or os.cpu_count() or 1
+    parallel = (
+        jobs > 1
+        and len(pending) > 1
+        and sum(len(meta_bytes) + len(events_bytes) for (_, meta_bytes, events_bytes, _) in pending) >= PARALLEL_THRESHOLD
+    )
+
+    if parallel:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(jobs, len(pending)),
+            initializer=initialize_worker,
+            initargs=(meta_schema, events_schema, lane_cache.enabled),
+        )
+
+        for event_lane_name, *arguments in pending:
+            results[event_lane_name] = executor.submit(parse_lane_in_worker, event_lane_name, *arguments)
+
+        executor.shutdown(wait=False)
+    else:
+        if pending and template_schemas is None:
+            template_schemas = TemplateSchemas(meta_schema, events_schema)
+
+        for event_lane_name, meta_bytes, events_bytes, cache_key in pending:
+            try:
+                lane, timings = parse_lane(event_lane_name, meta_bytes, events_bytes, template_schemas)
+            except Exception as exception:
+                results[event_lane_name].set_exception(exception)
+            else:
+                lane_cache.put(event_lane_name, cache_key, lane)
+                results[event_lane_name].set_result((lane, timings))
+
+    for event_lane_name, future in results.items():
+        try:
+            lane = future.result()
+        except Exception as exception:
+            yield event_lane_name, None, exception
+        else:
+            if not isinstance(lane, IngestedLane):
+                lane, timings = lane
+                lane = IngestedLane(event_lane_name, *lane, cached=False, timings=timings)
+
+            yield event_lane_name, lane, None
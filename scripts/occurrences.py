@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Index of every occurrence within a window of time, for range ("this week") and top-N ("up next") queries.
+"""
+
+import bisect
+import datetime
+import heapq
+import itertools
+import typing
+
+from definitions import EventLane, EventOccurrence, ScheduleSnapshot
+
+
+# Lanes' weeks start up to a week before now, so the index reaches back at least that far (and further, to the
+#  earliest week start, when a clock change makes a week longer than 7 days)
+LOOKBEHIND = datetime.timedelta(days=7)
+HORIZON = datetime.timedelta(days=14)
+
+
+def window_start(snapshot: ScheduleSnapshot) -> datetime.datetime:
+    """
+    Where the index starts for `snapshot`: early enough for every lane's current week.
+    """
+
+    return min([
+        snapshot.now - LOOKBEHIND, *(event_lane.week_start(snapshot.now) for event_lane in snapshot.event_lanes),
+    ]).astimezone(datetime.UTC)
+
+
+def by_time(occurrence: EventOccurrence) -> datetime.datetime:
+    return occurrence.when
+
+
+class OccurrenceIndex:
+    """
+    Every occurrence in [start, end), sorted per lane.
+
+    Each event's occurrences are already in order, so lanes are built with a k-way merge rather than a sort, and
+    queries bisect into each lane and merge the slices.
+    """
+
+    def __init__(self, event_lanes: list[EventLane], start: datetime.datetime, end: datetime.datetime):
+        self.start = start
+        self.end = end
+        self.lane_names = [event_lane.name for event_lane in event_lanes]
+        self.lane_occurrences: dict[str, list[EventOccurrence]] = {
+            event_lane.name: list(heapq.merge(*[
+                [EventOccurrence(when, event_lane, event) for when in event.occurrences_between(start, end)]
+                for event in event_lane.events
+            ], key=by_time))
+            for event_lane in event_lanes
+        }
+
+    @classmethod
+    def build(cls, snapshot: ScheduleSnapshot, horizon: datetime.timedelta = HORIZON) -> "OccurrenceIndex":
+        return cls(snapshot.event_lanes, window_start(snapshot), snapshot.now + horizon)
+
+    def lanes(self, lane_names: typing.Iterable[str] | None) -> list[list[EventOccurrence]]:
+        # Always in lane order, so ties come out the same way however the lanes were asked for
+        if lane_names is None:
+            return list(self.lane_occurrences.values())
+
+        lane_names = set(lane_names)
+        return [self.lane_occurrences[name] for name in self.lane_names if name in lane_names]
+
+    def between(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        lane_names: typing.Iterable[str] | None = None,
+    ) -> typing.Iterator[EventOccurrence]:
+        """
+        Every occurrence in [start, end) in the given lanes (or all of them), in order.
+        """
+
+        if start < self.start or end > self.end:
+            raise ValueError(f"{start} to {end} isn't within the indexed window of {self.start} to {self.end}")
+
+        return heapq.merge(*[
+            occurrences[bisect.bisect_left(occurrences, start, key=by_time):bisect.bisect_left(occurrences, end, key=by_time)]
+            for occurrences in self.lanes(lane_names)
+        ], key=by_time)
+
+    def next(
+        self,
+        count: int,
+        after: datetime.datetime,
+        lane_names: typing.Iterable[str] | None = None,
+    ) -> list[EventOccurrence]:
+        """
+        The next `count` occurrences at or after `after` in the given lanes (or all of them). Fewer are returned if
+        the window ends first.
+        """
+
+        if after < self.start:
+            raise ValueError(f"{after} is before the indexed window starting {self.start}")
+
+        return list(itertools.islice(heapq.merge(*[
+            itertools.islice(occurrences, bisect.bisect_left(occurrences, after, key=by_time), None)
+            for occurrences in self.lanes(lane_names)
+        ], key=by_time), count))
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""
+Writing generated artifacts: atomically, only when they've changed, with precompressed variants.
+"""
+
+import contextlib
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import typing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Artifacts that are served to clients get .gz (and .br, if brotli is installed) siblings
+PRECOMPRESSED_PATTERNS = [
+    "index.html",
+    "index.*.html",
+    "old.json",
+    "textmeshpro.*.txt",
+    "calendar/*.ics",
+]
+
+HASH_MANIFEST_FILENAME = "hashes.json"
+
+
+def current_umask() -> int:
+    # The umask can only be read by setting it, so this is done once at import, before any format threads start
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# What a plain open() would create files with. mkstemp's temporary files are 0600, and os.replace keeps that, which
+#  would leave the outputs unreadable to a web server running as another user
+FILE_MODE = 0o666 & ~current_umask()
+
+
+def write_atomically(path: pathlib.Path, content: bytes):
+    # Write to a temporary file next to the target and swap it in, so readers never see a half-written file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporary_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+
+    try:
+        os.fchmod(fd, FILE_MODE)
+
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(content)
+
+        os.replace(temporary_name, path)
+    except BaseException:
+        pathlib.Path(temporary_name).unlink(missing_ok=True)
+        raise
+
+
+COMPRESSORS: dict[str, typing.Callable[[bytes], bytes]] = {
+    # mtime=0 keeps the gzip output deterministic, so unchanged content compresses the same every build
+    ".gz": lambda content: gzip.compress(content, compresslevel=9, mtime=0),
+}
+
+if brotli is not None:
+    # Quality 11 squeezes out a few more percent but takes around 20x as long, which dominated big builds. 5 still
+    #  beats gzip -9 comfortably
+    COMPRESSORS[".br"] = lambda content: brotli.compress(content, quality=5)
+
+
+class HashingStream:
+    """
+    A text stream that writes UTF-8 to a file, hashing it as it goes.
+    """
+
+    def __init__(self, fp: typing.BinaryIO):
+        self.fp = fp
+        self.hash = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        data = text.encode('utf-8')
+        self.hash.update(data)
+        self.fp.write(data)
+        return len(text)
+
+
+class OutputWriter:
+    """
+    Writes output files, skipping any whose content hash hasn't changed since the last build.
+
+    The hashes are kept in a small manifest (hashes.json) alongside the outputs, which also lists what changed in
+    this build so downstream steps can upload only that.
+    """
+
+    def __init__(self, folder: pathlib.Path, precompressed_patterns: list[str] = PRECOMPRESSED_PATTERNS):
+        self.folder = folder
+        self.precompressed_patterns = precompressed_patterns
+        self.hashes: dict[str, str] = {}
+        self.changed: list[str] = []
+
+        try:
+            with open(folder / HASH_MANIFEST_FILENAME, 'r', encoding='utf-8') as fp:
+                self.previous_hashes: dict[str, str] = json.load(fp)["files"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.previous_hashes = {}
+
+    def is_precompressed(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.precompressed_patterns)
+
+    def previous_hash(self, name: str) -> str | None:
+        path = self.folder / name
+
+        if not path.exists():
+            return None
+
+        if name in self.previous_hashes:
+            return self.previous_hashes[name]
+
+        # No manifest entry (e.g. first build with a manifest), so hash what's there
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+
+    def write(self, name: str, content: str | bytes) -> bool:
+        """
+        Writes `name` if its content changed, returning whether it did.
+        """
+
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+
+        if self.record(name, hashlib.sha256(content).hexdigest()):
+            return False
+
+        write_atomically(self.folder / name, content)
+
+        self.changed.append(name)
+        self.changed.extend(self.write_variants(name, content))
+        return True
+
+    @contextlib.contextmanager
+    def open(self, name: str) -> typing.Iterator["HashingStream"]:
+        """
+        Streams text to `name`, which is only swapped in (and counted as changed) if its content changed.
+        """
+
+        path = self.folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temporary_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+
+        try:
+            os.fchmod(fd, FILE_MODE)
+
+            with os.fdopen(fd, 'wb') as fp:
+                stream = HashingStream(fp)
+                yield stream
+
+            if self.record(name, stream.hash.hexdigest()):
+                pathlib.Path(temporary_name).unlink()
+                return
+
+            os.replace(temporary_name, path)
+        except BaseException:
+            pathlib.Path(temporary_name).unlink(missing_ok=True)
+            raise
+
+        self.changed.append(name)
+
+        if self.is_precompressed(name):
+            self.changed.extend(self.write_variants(name, path.read_bytes()))
+
+    def record(self, name: str, digest: str) -> bool:
+        """
+        Records the hash of `name` (and its compressed variants), returning whether it's unchanged on disk.
+        """
+
+        variants = list(COMPRESSORS) if self.is_precompressed(name) else []
+        self.hashes[name] = digest
+
+        # Compressed variants are recorded under the hash of the content they were compressed from
+        for suffix in variants:
+            self.hashes[name + suffix] = digest
+
+        return self.previous_hash(name) == digest and all(
+            (self.folder / (name + suffix)).exists() and self.previous_hashes.get(name + suffix, None) == digest
+            for suffix in variants
+        )
+
+    def write_variants(self, name: str, content: bytes) -> list[str]:
+        # Returns the names of the variants written, which changed along with `name`
+        if not self.is_precompressed(name):
+            return []
+
+        for suffix in COMPRESSORS:
+            write_atomically(self.folder / (name + suffix), COMPRESSORS[suffix](content))
+
+        return [name + suffix for suffix in COMPRESSORS]
+
+    def finish(self) -> list[str]:
+        """
+        Writes the hash manifest, returning the names of the outputs that changed.
+        """
+
+        # Keep entries for anything this build didn't touch (e.g. a format that failed) so it isn't re-uploaded
+        manifest: dict[str, typing.Any] = {
+            "files": dict(sorted({
+                **{name: digest for name, digest in self.previous_hashes.items() if (self.folder / name).exists()},
+                **self.hashes,
+            }.items())),
+            "changed": sorted(self.changed),
+        }
+        write_atomically(self.folder / HASH_MANIFEST_FILENAME, (json.dumps(manifest, indent=2) + "\n").encode('utf-8'))
+
+        return self.changed
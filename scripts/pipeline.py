@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Small dependency-aware executor for running output formats concurrently.
+"""
+
+import concurrent.futures
+import threading
+import typing
+
+from reporting import Elapsed, Stopwatch
+
+
+class Provider(typing.NamedTuple):
+    callback: typing.Callable[..., typing.Any]
+    requires: tuple[str, ...]
+
+
+class Job(typing.Protocol):
+    callback: typing.Callable[..., typing.Any]
+    requires: tuple[str, ...]
+
+
+JobT = typing.TypeVar("JobT", bound=Job)
+
+
+class Pipeline:
+    """
+    Resolves named inputs for jobs, computing each shared input at most once.
+
+    `inputs` are values known up front (e.g. the parsed event lanes), `providers` describe how to compute
+    intermediate values from other inputs. Jobs are run on a thread pool so that slow, blocking jobs (like
+    sending webhooks) don't hold up the others.
+    """
+
+    def __init__(self, inputs: dict[str, typing.Any], providers: dict[str, Provider]):
+        self.providers = providers
+        self.values: dict[str, concurrent.futures.Future] = {}
+        # How long each provider took, not counting the inputs it waited for
+        self.timings: dict[str, Elapsed] = {}
+        self.lock = threading.Lock()
+
+        for name, value in inputs.items():
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            future.set_result(value)
+            self.values[name] = future
+
+    def resolve(self, name: str, resolving: tuple[str, ...] = ()) -> typing.Any:
+        if name in resolving:
+            raise RuntimeError(f"Circular dependency while resolving `{name}`: {' -> '.join(resolving + (name,))}")
+
+        with self.lock:
+            future = self.values.get(name, None)
+            owner = future is None
+
+            if owner:
+                if name not in self.providers:
+                    raise KeyError(f"Nothing provides the input `{name}`")
+
+                future = self.values[name] = concurrent.futures.Future()
+
+        # Whichever thread asks first computes the value, everyone else waits for it
+        if owner:
+            provider = self.providers[name]
+
+            try:
+                arguments = [self.resolve(requirement, resolving + (name,)) for requirement in provider.requires]
+                stopwatch = Stopwatch()
+                value = provider.callback(*arguments)
+                self.timings[name] = stopwatch.elapsed()
+                future.set_result(value)
+            except BaseException as exception:
+                future.set_exception(exception)
+
+        return future.result()
+
+    def call(self, job: Job) -> typing.Any:
+        return job.callback(*[self.resolve(requirement) for requirement in job.requires])
+
+    def timed_call(self, job: Job) -> tuple[typing.Any, BaseException | None, Elapsed]:
+        # Inputs are resolved before the stopwatch starts, so shared work isn't billed to whichever job asked first
+        try:
+            arguments = [self.resolve(requirement) for requirement in job.requires]
+        except Exception as exception:
+            return None, exception, Elapsed(0.0, 0.0)
+
+        stopwatch = Stopwatch()
+
+        try:
+            return job.callback(*arguments), None, stopwatch.elapsed()
+        except Exception as exception:
+            return None, exception, stopwatch.elapsed()
+
+    def run(self, jobs: list[JobT], max_workers: int | None = None) -> typing.Iterator[tuple[JobT, typing.Any, BaseException | None, Elapsed]]:
+        """
+        Runs every job, yielding `(job, result, exception, elapsed)` as each one finishes.
+
+        A failing job does not stop the others, so every failure can be reported individually.
+        """
+
+        if max_workers == 1:
+            # Run inline, which keeps tracebacks and profilers simple
+            for job in jobs:
+                yield job, *self.timed_call(job)
+
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(jobs) or 1) as executor:
+            futures = {executor.submit(self.timed_call, job): job for job in jobs}
+
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], *future.result()
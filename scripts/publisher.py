@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent webhook publisher, so all lanes' schedule messages are updated at once.
+"""
+
+import asyncio
+import dataclasses
+import re
+import time
+import typing
+import urllib.parse
+
+if typing.TYPE_CHECKING:
+    import aiohttp
+
+
+WEBHOOK_URL_REGEX = re.compile(r"/api/webhooks/(?P<id>[0-9]{17,20})/(?P<token>[A-Za-z0-9.\-_]{60,68})/?$")
+
+
+class WebhookJob(typing.NamedTuple):
+    lane_name: str
+    url: str
+    message_id: int | None
+    payload: dict[str, typing.Any]
+
+
+def validate_webhook_url(url: str) -> str:
+    # Same shape discord.py's Webhook.from_url accepts
+    if WEBHOOK_URL_REGEX.search(urllib.parse.urlsplit(url).path) is None:
+        raise ValueError("Invalid webhook URL given.")
+
+    return url
+
+
+@dataclasses.dataclass
+class WebhookPublisher:
+    # If set, the scheme and host of every webhook URL are swapped for this (e.g. a local stand-in server)
+    base_url: str | None = None
+    # Maximum number of requests in flight at once
+    max_in_flight: int = 4
+    # How many times a request is retried on rate limits (or, for edits, server and connection errors) before giving up
+    max_retries: int = 5
+    # Base delay for exponential backoff on server/connection errors, in seconds
+    backoff: float = 0.5
+    timeout: float = 30.0
+
+    def resolve_url(self, url: str) -> str:
+        if not self.base_url:
+            return url
+
+        base = urllib.parse.urlsplit(self.base_url)
+        return urllib.parse.urlsplit(url)._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+
+    def publish(self, jobs: list[WebhookJob]) -> dict[str, int]:
+        """
+        Sends or edits every job's message, returning the message ID for each lane.
+        """
+
+        if not jobs:
+            return {}
+
+        return asyncio.run(self.publish_async(jobs))
+
+    async def publish_async(self, jobs: list[WebhookJob]) -> dict[str, int]:
+        # aiohttp is slow to import, and most builds have nothing to publish
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        # Webhooks are rate limited per bucket, keep track of when each bucket frees up
+        bucket_resets: dict[str, float] = {}
+
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            results = await asyncio.gather(
+                *[self.publish_one(session, semaphore, bucket_resets, job) for job in jobs],
+                return_exceptions=True,
+            )
+
+        failures = [
+            f"{job.lane_name}: {result!r}"
+            for job, result in zip(jobs, results)
+            if isinstance(result, BaseException)
+        ]
+
+        if failures:
+            raise RuntimeError("Failed to publish webhooks for " + ", ".join(failures))
+
+        return {job.lane_name: result for job, result in zip(jobs, results)}
+
+    async def publish_one(
+        self,
+        session: "aiohttp.ClientSession",
+        semaphore: asyncio.Semaphore,
+        bucket_resets: dict[str, float],
+        job: WebhookJob,
+    ) -> int:
+        import aiohttp
+
+        url = self.resolve_url(job.url).rstrip("/")
+
+        if job.message_id:
+            method, url, params = "PATCH", f"{url}/messages/{job.message_id}", {}
+        else:
+            method, params = "POST", {"wait": "true"}
+
+        bucket = url
+        # Editing a message again is harmless, but a POST that timed out (or got a server error) may still have
+        #  created one, and retrying it could post the schedule twice. So POSTs are only retried on rate limits,
+        #  which Discord rejects without processing
+        retries_errors = method != "POST"
+
+        for attempt in range(self.max_retries + 1):
+            # Don't fire a request we already know will be rate limited
+            delay = bucket_resets.get(bucket, 0.0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            async with semaphore:
+                try:
+                    async with session.request(method, url, params=params, json=job.payload) as response:
+                        headers = response.headers
+                        bucket = headers.get("X-RateLimit-Bucket", bucket)
+
+                        if headers.get("X-RateLimit-Remaining") == "0":
+                            bucket_resets[bucket] = time.monotonic() + float(headers.get("X-RateLimit-Reset-After", 0))
+
+                        if response.status == 429:
+                            data = await response.json(content_type=None)
+                            retry_after = float(data.get("retry_after", None) or headers.get("Retry-After", 1))
+                            bucket_resets[bucket] = time.monotonic() + retry_after
+                            continue
+
+                        if response.status >= 500:
+                            error: BaseException = RuntimeError(f"{method} returned HTTP {response.status}")
+                        else:
+                            response.raise_for_status()
+                            data = await response.json(content_type=None)
+                            return int(data["id"])
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exception:
+                    error = exception
+
+            if attempt == self.max_retries or not retries_errors:
+                raise error
+
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+
+        raise RuntimeError(f"Still rate limited after {self.max_retries} retries")
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+Console reporting and per-stage timing for the build.
+"""
+
+import contextlib
+import datetime
+import json
+import pathlib
+import threading
+import time
+import traceback
+import typing
+
+import click
+
+
+class Elapsed(typing.NamedTuple):
+    wall: float
+    cpu: float
+
+    def __add__(self, other: "Elapsed") -> "Elapsed":
+        return Elapsed(self.wall + other.wall, self.cpu + other.cpu)
+
+
+class Stopwatch:
+    """
+    Measures wall time and CPU time of the current thread, which stays correct when stages run on a thread pool.
+    """
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def elapsed(self) -> Elapsed:
+        return Elapsed(time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+
+
+class StageTimings(dict[str, tuple[Elapsed, int]]):
+    """
+    Accumulated time and item counts per stage name. Picklable, so it can come back from worker processes.
+    """
+
+    def add(self, stage: str, elapsed: Elapsed, items: int = 0):
+        previous_elapsed, previous_items = self.get(stage, (Elapsed(0.0, 0.0), 0))
+        self[stage] = (previous_elapsed + elapsed, previous_items + items)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str, items: int = 0):
+        stopwatch = Stopwatch()
+
+        try:
+            yield
+        finally:
+            self.add(stage, stopwatch.elapsed(), items)
+
+
+class Span(typing.NamedTuple):
+    stage: str
+    elapsed: Elapsed
+    items: int | None
+    lane: str | None
+    failed: bool
+
+
+class BuildReporter:
+    """
+    Prints progress for each step of the build (unless quiet) and records how long each one took.
+    """
+
+    def __init__(self, quiet: bool = False):
+        self.quiet = quiet
+        self.spans: list[Span] = []
+        self.started = datetime.datetime.now(datetime.UTC)
+        self.stopwatch = Stopwatch()
+        self.lock = threading.Lock()
+
+    def echo(self, message: str, **style):
+        if not self.quiet:
+            click.secho(message, **style)
+
+    def warn(self, message: str):
+        # Warnings are shown even when quiet
+        click.secho(message, fg='yellow', err=self.quiet)
+
+    def record(self, stage: str, elapsed: Elapsed, items: int | None = None, lane: str | None = None, failed: bool = False):
+        with self.lock:
+            self.spans.append(Span(stage, elapsed, items, lane, failed))
+
+    def record_timings(self, timings: StageTimings, lane: str | None = None):
+        for stage, (elapsed, items) in timings.items():
+            self.record(stage, elapsed, items or None, lane)
+
+    @contextlib.contextmanager
+    def step(self, label: str, stage: str | None = None, items: int | None = None, lane: str | None = None):
+        """
+        Reports a step as OK or FAILED and, if given a stage name, records its timing.
+        """
+
+        stopwatch = Stopwatch()
+
+        if not self.quiet:
+            click.secho(f"{label}... ", nl=False)
+
+        try:
+            yield
+        except BaseException:
+            if not self.quiet:
+                click.secho("FAILED", fg='red')
+            else:
+                click.secho(f"{label.strip()}... FAILED", fg='red', err=True)
+
+            if stage is not None:
+                self.record(stage, stopwatch.elapsed(), items, lane, failed=True)
+
+            raise
+        else:
+            if not self.quiet:
+                click.secho("OK", fg='green')
+
+            if stage is not None:
+                self.record(stage, stopwatch.elapsed(), items, lane)
+
+    def result(self, label: str, exception: BaseException | None):
+        """
+        Like `step`, but for steps that have already finished elsewhere (e.g. on another thread).
+        """
+
+        # Printed in one go so output from other threads can't land in the middle of the line
+        if exception is None:
+            self.echo(f"{label}... " + click.style("OK", fg='green'))
+        else:
+            click.echo(f"{label}... " + click.style("FAILED", fg='red'), err=self.quiet)
+            click.echo("".join(traceback.format_exception(exception)), err=True)
+
+    def to_json(self) -> dict[str, typing.Any]:
+        total = self.stopwatch.elapsed()
+
+        return {
+            "started": self.started.isoformat(),
+            "wall_seconds": total.wall,
+            # CPU time of the main thread only, stages on other threads/processes are counted in their own spans
+            "main_thread_cpu_seconds": total.cpu,
+            "spans": [
+                {
+                    "stage": span.stage,
+                    **({"lane": span.lane} if span.lane else {}),
+                    "wall_seconds": span.elapsed.wall,
+                    "cpu_seconds": span.elapsed.cpu,
+                    **({"items": span.items} if span.items is not None else {}),
+                    **({"failed": True} if span.failed else {}),
+                }
+                for span in self.spans
+            ],
+        }
+
+    def write(self, path: pathlib.Path):
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(self.to_json(), fp, indent=2)
+            fp.write("\n")
+
+
+# The reporter for the build that's currently running
+reporter = BuildReporter()
+
+
+def report_error(label: str, stage: str | None = None, items: int | None = None, lane: str | None = None):
+    return reporter.step(label, stage, items, lane)
+
+
+def report_result(label: str, exception: BaseException | None):
+    reporter.result(label, exception)
+
+
+def echo(message: str, **style):
+    reporter.echo(message, **style)
+
+
+def warn(message: str):
+    reporter.warn(message)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+Resident scheduler mode, which rebuilds exactly when the outputs would next change.
+"""
+
+import datetime
+import time
+
+import click
+
+import reporting
+from builder import build
+from reporting import BuildReporter
+
+
+# Rebuild just after the change, so the occurrence that triggered it has definitely passed
+CHANGE_MARGIN = datetime.timedelta(seconds=1)
+# If a build fails, try again after this long
+RETRY_AFTER = datetime.timedelta(minutes=5)
+# Rebuild at least this often, even if nothing is due to change
+MAX_IDLE = datetime.timedelta(days=1)
+# Sleep in steps of at most this long, checking the clock in between, so a suspended machine or an adjusted clock
+#  doesn't make us oversleep
+MAX_SLEEP_SECONDS = 60.0
+
+
+def sleep_until(moment: datetime.datetime):
+    while True:
+        remaining = (moment - datetime.datetime.now(datetime.UTC)).total_seconds()
+
+        if remaining <= 0:
+            return
+
+        time.sleep(min(remaining, MAX_SLEEP_SECONDS))
+
+
+def run_scheduled(quiet: bool = False, **build_arguments):
+    """
+    Builds, then sleeps until the outputs next change and builds again, until interrupted.
+    """
+
+    try:
+        while True:
+            reporting.reporter = BuildReporter(quiet=quiet)
+            started = datetime.datetime.now(datetime.UTC)
+
+            try:
+                next_change = build(**build_arguments)
+            except click.ClickException as exception:
+                reporting.warn(f"Build failed ({exception.message}), trying again in {RETRY_AFTER}")
+                wake = started + RETRY_AFTER
+            except Exception as exception:
+                # Anything else (e.g. a malformed webhook URL, or Discord being unreachable) is just as likely to
+                #  clear up by the next try, so it shouldn't stop the loop
+                reporting.warn(f"Build failed ({exception!r}), trying again in {RETRY_AFTER}")
+                wake = started + RETRY_AFTER
+            else:
+                wake = started + MAX_IDLE
+
+                if next_change is not None:
+                    wake = min(wake, next_change.when + CHANGE_MARGIN)
+
+            reporting.echo(f"Sleeping until {wake.astimezone(datetime.UTC):%Y-%m-%d %H:%M:%S} UTC", fg='blue')
+            sleep_until(wake)
+    except KeyboardInterrupt:
+        pass
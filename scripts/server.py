@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+Resident serving mode, which serves the schedule over HTTP with time-relative fields (like old.json's time_until)
+worked out when requested rather than when last built.
+
+Lanes are parsed once at startup. Each output is rendered at most once a minute, however many clients ask for it,
+and served with an ETag (so unchanged polls get a 304) and gzip for clients that accept it.
+
+    python scripts/build_manifests.py --serve --port 8080
+"""
+
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import mimetypes
+import threading
+import typing
+
+import reporting
+from builder import find_lane_folders, load_event_lanes, load_schemas
+from definitions import EventLane, ScheduleSnapshot
+from formats.all import OUTPUT_FORMATS, SHARED_INPUTS, OutputFormat, select_formats
+from ingestion import LaneCache
+from output import COMPRESSORS
+from pipeline import Pipeline, Provider
+
+if typing.TYPE_CHECKING:
+    from aiohttp import web
+
+
+SERVED_FORMATS = select_formats(["old.json", "textmeshpro.*", "index*.html"])
+
+# Served for the root path
+INDEX_FILENAME = "index.html"
+
+# Outputs are rendered for the start of each minute, so they're good until the next one
+RENDER_PERIOD = datetime.timedelta(minutes=1)
+
+
+class MemoryWriter:
+    """
+    Stands in for an OutputWriter for formats that stream their files, keeping what they write in memory.
+    """
+
+    def __init__(self):
+        self.files: dict[str, str] = {}
+
+    @contextlib.contextmanager
+    def open(self, name: str) -> typing.Iterator[io.StringIO]:
+        stream = io.StringIO()
+        yield stream
+        self.files[name] = stream.getvalue()
+
+
+class RenderedOutput(typing.NamedTuple):
+    period: datetime.datetime
+    body: bytes
+    gzipped: bytes
+    etag: str
+    content_type: str
+
+
+def period_start(now: datetime.datetime) -> datetime.datetime:
+    return now.replace(second=0, microsecond=0)
+
+
+class ScheduleServer:
+    """
+    Renders outputs from the lanes, caching each one for the rest of the minute it was rendered in.
+    """
+
+    def __init__(self, event_lanes: list[EventLane], output_formats: list[OutputFormat] = SERVED_FORMATS):
+        self.event_lanes = event_lanes
+        self.output_formats = {
+            filename: output_format for output_format in output_formats for filename in output_format.filenames
+        }
+        self.rendered: dict[str, RenderedOutput] = {}
+        self.period: datetime.datetime | None = None
+        self.pipeline: Pipeline | None = None
+        self.writer = MemoryWriter()
+        # Rendering happens off the event loop, and clients that arrive while an output is rendering wait for it
+        #  rather than rendering it again
+        self.lock = threading.Lock()
+
+    def cached(self, name: str, period: datetime.datetime) -> RenderedOutput | None:
+        rendered = self.rendered.get(name, None)
+        return rendered if rendered is not None and rendered.period == period else None
+
+    def start_period(self, period: datetime.datetime):
+        # Every output in a period shares one snapshot (and occurrence math) taken at its start
+        self.period = period
+        self.writer = MemoryWriter()
+        self.pipeline = Pipeline(
+            # Pages only link to what's served here, rather than every file a build writes
+            {
+                "event_lanes": self.event_lanes,
+                "now": period,
+                "output_writer": self.writer,
+                "output_filenames": list(self.output_formats),
+            },
+            {**SHARED_INPUTS, "snapshot": Provider(ScheduleSnapshot.build, ("event_lanes", "now"))},
+        )
+
+    def render(self, name: str, period: datetime.datetime) -> RenderedOutput:
+        with self.lock:
+            rendered = self.cached(name, period)
+
+            if rendered is not None:
+                return rendered
+
+            if period != self.period:
+                self.start_period(period)
+
+            output_format = self.output_formats[name]
+            output, exception, _elapsed = self.pipeline.timed_call(output_format)
+
+            if exception is not None:
+                raise exception
+
+            # Formats that write several files (e.g. every language) render them all at once, so cache them all
+            if output_format.streams:
+                outputs = {filename: self.writer.files[filename] for filename in output}
+            elif not isinstance(output, str):
+                outputs = {name: json.dumps(output, indent=2)}
+            else:
+                outputs = {name: output}
+
+            for filename, content in outputs.items():
+                body = content.encode('utf-8')
+                content_type, _encoding = mimetypes.guess_type(filename)
+
+                self.rendered[filename] = RenderedOutput(
+                    period=period,
+                    body=body,
+                    gzipped=COMPRESSORS[".gz"](body),
+                    etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+                    content_type=f"{content_type or 'application/octet-stream'}; charset=utf-8",
+                )
+
+            return self.rendered[name]
+
+    async def get(self, name: str) -> RenderedOutput:
+        period = period_start(datetime.datetime.now(datetime.UTC))
+
+        # Almost every request is answered from here without leaving the event loop
+        return self.cached(name, period) or await asyncio.to_thread(self.render, name, period)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip, i.e. gives it (or failing that, "*") a non-zero q-value.
+    """
+
+    qualities: dict[str, float] = {}
+
+    for part in (accept_encoding or "").split(","):
+        coding, *parameters = [item.strip() for item in part.split(";")]
+
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if coding:
+            qualities[coding.lower()] = quality
+
+    return qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0))) > 0
+
+
+def create_app(schedule_server: ScheduleServer) -> "web.Application":
+    from aiohttp import web
+
+    async def serve_output(request: web.Request) -> web.StreamResponse:
+        name = request.match_info.get("name", "") or INDEX_FILENAME
+
+        if name not in schedule_server.output_formats:
+            raise web.HTTPNotFound()
+
+        try:
+            rendered = await schedule_server.get(name)
+        except Exception as exception:
+            reporting.warn(f"Could not render {name}: {exception!r}")
+            raise web.HTTPInternalServerError()
+
+        expires = rendered.period + RENDER_PERIOD
+        max_age = max(int((expires - datetime.datetime.now(datetime.UTC)).total_seconds()), 0)
+        headers = {
+            "ETag": rendered.etag,
+            "Cache-Control": f"public, max-age={max_age}",
+            "Vary": "Accept-Encoding",
+        }
+
+        if etag_matches(request.headers.get("If-None-Match", None), rendered.etag):
+            return web.Response(status=304, headers=headers)
+
+        if accepts_gzip(request.headers.get("Accept-Encoding", None)):
+            return web.Response(body=rendered.gzipped, headers={
+                **headers, "Content-Type": rendered.content_type, "Content-Encoding": "gzip",
+            })
+
+        return web.Response(body=rendered.body, headers={**headers, "Content-Type": rendered.content_type})
+
+    app = web.Application()
+    app.add_routes([
+        web.get("/", serve_output),
+        web.get("/{name:.+}", serve_output),
+    ])
+
+    return app
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    no_cache: bool = False,
+    output_formats: list[OutputFormat] = OUTPUT_FORMATS,
+    lane_names: set[str] | None = None,
+):
+    """
+    Loads the lanes once, then serves the servable formats among `output_formats` until interrupted.
+
+    Edits to templates aren't picked up, restart to serve them.
+    """
+
+    from aiohttp import web
+
+    served_formats = [output_format for output_format in SERVED_FORMATS if output_format in output_formats]
+
+    reporting.echo("Reading schemas...", fg='blue')
+    meta_schema, events_schema = load_schemas()
+
+    reporting.echo("Reading event lane templates...", fg='blue')
+    lane_folders = [
+        lane_folder for lane_folder in find_lane_folders()
+        if lane_names is None or lane_folder.name in lane_names
+    ]
+    event_lanes = load_event_lanes(
+        lane_folders, meta_schema, events_schema, LaneCache(enabled=not no_cache), resolve_webhooks=False,
+    )
+
+    reporting.echo(
+        f"Serving {', '.join(filename for output_format in served_formats for filename in output_format.filenames)} "
+        f"on http://{host}:{port}, press Ctrl+C to stop",
+        fg='blue',
+    )
+    web.run_app(create_app(ScheduleServer(event_lanes, served_formats)), host=host, port=port, print=None)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for overlapping event warnings, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import datetime
+import unittest
+from zoneinfo import ZoneInfo
+
+import reporting
+from builder import check_conflicts
+from definitions import EventLane, EventLaneEvent
+
+
+def make_event(name: str, host: str, hour: int, not_after: datetime.date | None = None) -> EventLaneEvent:
+    return EventLaneEvent(
+        defined_line=1,
+        host=host,
+        name=name,
+        tags=(),
+        paused=False,
+        basis=datetime.datetime(2026, 1, 5, hour, 0, tzinfo=ZoneInfo("Europe/London")),
+        timezone="Europe/London",
+        interval=7,
+        duration=90,
+        not_before=None,
+        not_after=not_after,
+    )
+
+
+def make_lane(events: list[EventLaneEvent]) -> EventLane:
+    return EventLane(
+        name="sign_language_bsl",
+        meta={"channels": {}, "default_timezone": "Europe/London"},
+        events=events,
+        webhook_url=None,
+        webhook_info=None,
+        webhook_message_id=None,
+    )
+
+
+class CheckConflictsTest(unittest.TestCase):
+    def setUp(self):
+        self.quiet, reporting.reporter.quiet = reporting.reporter.quiet, True
+
+    def tearDown(self):
+        reporting.reporter.quiet = self.quiet
+
+    def test_uses_the_given_now(self):
+        # The second event overlaps the first by half an hour, but only until it ends
+        event_lanes = [make_lane([
+            make_event("First", "Host A", 20),
+            make_event("Second", "Host B", 21, not_after=datetime.date(2026, 3, 1)),
+        ])]
+        horizon = datetime.timedelta(days=28)
+
+        conflicts = check_conflicts(event_lanes, datetime.datetime(2026, 2, 1, tzinfo=datetime.UTC), horizon)
+        self.assertEqual([(conflict.first.event.name, conflict.second.event.name) for conflict in conflicts], [("First", "Second")])
+
+        self.assertEqual(check_conflicts(event_lanes, datetime.datetime(2026, 4, 1, tzinfo=datetime.UTC), horizon), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the event occurrence solver, run from scripts/ with `python -m unittest discover -s tests`
+
+Each case is checked against stepping through the occurrences one at a time from well before the target, which is
+how occurrences used to be found.
+"""
+
+import datetime
+import itertools
+import math
+import typing
+import unittest
+from zoneinfo import ZoneInfo
+
+import columnar
+from definitions import EventLaneEvent
+
+
+def make_event(
+    timezone: str,
+    basis: datetime.datetime,
+    interval: float = 7,
+    not_before: datetime.date | None = None,
+    not_after: datetime.date | None = None,
+) -> EventLaneEvent:
+    return EventLaneEvent(
+        defined_line=1,
+        host="Host",
+        name="Event",
+        tags=(),
+        paused=False,
+        basis=basis.replace(tzinfo=ZoneInfo(timezone)),
+        timezone=timezone,
+        interval=interval,
+        duration=60,
+        not_before=not_before,
+        not_after=not_after,
+    )
+
+
+def stepped_first_index(event: EventLaneEvent, target: datetime.datetime) -> int:
+    # Start far enough back that no DST shift can put the first step past the answer
+    index = math.floor((target - event.basis) / datetime.timedelta(days=event.interval)) - 10
+    assert event.occurrence_at(index) < target
+
+    while event.occurrence_at(index) < target or (event.not_before and event.occurrence_at(index).date() < event.not_before):
+        index += 1
+
+    return index
+
+
+def stepped_occurrences_between(event: EventLaneEvent, start: datetime.datetime, end: datetime.datetime) -> list[datetime.datetime]:
+    occurrences = []
+
+    for index in itertools.count(stepped_first_index(event, start)):
+        needle = event.occurrence_at(index)
+
+        if needle >= end or (event.not_after and needle.date() > event.not_after):
+            return occurrences
+
+        occurrences.append(needle)
+
+
+def sweep(start: datetime.datetime, end: datetime.datetime, step: datetime.timedelta) -> typing.Iterator[datetime.datetime]:
+    while start < end:
+        yield start
+        start += step
+
+
+class OccurrenceSolverTest(unittest.TestCase):
+    def assert_matches_stepping(self, event: EventLaneEvent, targets: typing.Iterable[datetime.datetime]):
+        for target in targets:
+            with self.subTest(target=target):
+                self.assertEqual(event.first_occurrence_index(target), stepped_first_index(event, target))
+
+                end = target + datetime.timedelta(days=30)
+                self.assertEqual(list(event.occurrences_between(target, end)), stepped_occurrences_between(event, target, end))
+
+    def test_ranges_straddling_dst_changes(self):
+        # Including events at the hour that's skipped or repeated when the clocks change, and a zone that shifts by
+        #  half an hour
+        events = [
+            make_event("Europe/London", datetime.datetime(2026, 1, 5, 20, 0)),
+            make_event("Europe/London", datetime.datetime(2026, 3, 29, 1, 30), interval=1),
+            make_event("Europe/London", datetime.datetime(2026, 10, 25, 1, 30), interval=1),
+            make_event("America/New_York", datetime.datetime(2026, 1, 4, 23, 0), interval=14),
+            make_event("Australia/Lord_Howe", datetime.datetime(2026, 1, 3, 2, 15), interval=2),
+        ]
+
+        # Every 7h 13m over a year, to land at every phase of each interval
+        targets = list(sweep(
+            datetime.datetime(2025, 12, 1, tzinfo=datetime.UTC),
+            datetime.datetime(2027, 1, 1, tzinfo=datetime.UTC),
+            datetime.timedelta(hours=7, minutes=13),
+        ))
+
+        for event in events:
+            with self.subTest(timezone=event.timezone, basis=event.basis):
+                self.assert_matches_stepping(event, targets)
+
+    def test_targets_on_an_occurrence(self):
+        event = make_event("Europe/London", datetime.datetime(2026, 1, 5, 20, 0))
+        occurrences = [event.occurrence_at(index) for index in range(-10, 60)]
+        nudge = datetime.timedelta(microseconds=1)
+
+        self.assert_matches_stepping(event, [
+            when + offset for when in occurrences for offset in (-nudge, datetime.timedelta(0), nudge)
+        ])
+
+        # An occurrence is included when the target is exactly on it
+        for index, when in zip(range(-10, 60), occurrences):
+            self.assertEqual(event.first_occurrence_index(when), index)
+            self.assertEqual(event.first_occurrence_index(when + nudge), index + 1)
+
+    def test_not_before_and_not_after(self):
+        event = make_event(
+            "Europe/London", datetime.datetime(2026, 1, 5, 20, 0),
+            not_before=datetime.date(2026, 3, 1), not_after=datetime.date(2026, 11, 2),
+        )
+
+        self.assert_matches_stepping(event, sweep(
+            datetime.datetime(2025, 12, 1, tzinfo=datetime.UTC),
+            datetime.datetime(2027, 1, 1, tzinfo=datetime.UTC),
+            datetime.timedelta(hours=11, minutes=7),
+        ))
+
+        occurrences = list(event.occurrences_between(
+            datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC), datetime.datetime(2028, 1, 1, tzinfo=datetime.UTC),
+        ))
+        self.assertEqual(occurrences[0].date(), datetime.date(2026, 3, 2))
+        self.assertEqual(occurrences[-1].date(), datetime.date(2026, 11, 2))
+
+    def test_non_integer_intervals(self):
+        # Late in the day, so some occurrences fall on the day after a whole number of intervals
+        events = [
+            make_event("Europe/London", datetime.datetime(2026, 1, 5, 20, 0), interval=3.5),
+            make_event("Europe/London", datetime.datetime(2026, 1, 5, 22, 0), interval=0.75),
+            make_event(
+                "America/New_York", datetime.datetime(2026, 1, 5, 21, 30), interval=10.25,
+                not_before=datetime.date(2026, 3, 9), not_after=datetime.date(2026, 11, 20),
+            ),
+            make_event(
+                "Europe/London", datetime.datetime(2026, 1, 5, 20, 0), interval=3.5,
+                not_before=datetime.date(2026, 1, 9), not_after=datetime.date(2026, 12, 1),
+            ),
+        ]
+
+        targets = list(sweep(
+            datetime.datetime(2025, 12, 1, tzinfo=datetime.UTC),
+            datetime.datetime(2027, 1, 1, tzinfo=datetime.UTC),
+            datetime.timedelta(hours=5, minutes=17),
+        ))
+
+        for event in events:
+            with self.subTest(interval=event.interval, not_before=event.not_before):
+                self.assert_matches_stepping(event, targets)
+
+
+@unittest.skipIf(columnar.numpy is None, "needs numpy")
+class ColumnarBoundsTest(unittest.TestCase):
+    def test_bounds_match_the_per_event_path(self):
+        events = [
+            make_event(
+                "Europe/London", datetime.datetime(2026, 1, 5, 20, 0), interval=3.5,
+                not_before=datetime.date(2026, 1, 9), not_after=datetime.date(2026, 6, 11),
+            ),
+            make_event(
+                "America/New_York", datetime.datetime(2026, 1, 5, 21, 30), interval=10.25,
+                not_before=datetime.date(2026, 3, 9), not_after=datetime.date(2026, 11, 20),
+            ),
+            make_event(
+                "Europe/London", datetime.datetime(2026, 1, 5, 20, 0),
+                not_before=datetime.date(2026, 3, 1), not_after=datetime.date(2026, 11, 2),
+            ),
+        ]
+        columnar_events = columnar.ColumnarEvents(events)
+
+        for target in sweep(
+            datetime.datetime(2025, 12, 1, tzinfo=datetime.UTC),
+            datetime.datetime(2027, 1, 1, tzinfo=datetime.UTC),
+            datetime.timedelta(hours=5, minutes=17),
+        ):
+            with self.subTest(target=target):
+                self.assertEqual(columnar_events.next_occurrences(target), [event.next_occurrence_after(target) for event in events])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the iCalendar format, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import datetime
+import pathlib
+import tempfile
+import unittest
+from zoneinfo import ZoneInfo
+
+from definitions import EventLane, EventLaneEvent, ScheduleSnapshot
+from formats.ical import GLOBAL_CALENDAR_FILENAME, event_lines, format_local, generate_ical
+from output import OutputWriter
+
+
+NOW = datetime.datetime(2026, 10, 14, 15, 32, tzinfo=datetime.UTC)
+
+
+def make_event(name: str, interval: float, not_after: datetime.date | None = None) -> EventLaneEvent:
+    return EventLaneEvent(
+        defined_line=1,
+        host="Host",
+        name=name,
+        tags=(),
+        paused=False,
+        basis=datetime.datetime(2026, 9, 5, 20, 0, tzinfo=ZoneInfo("Europe/London")),
+        timezone="Europe/London",
+        interval=interval,
+        duration=60,
+        not_before=None,
+        not_after=not_after,
+    )
+
+
+def make_lane(name: str, events: list[EventLaneEvent]) -> EventLane:
+    return EventLane(
+        name=name,
+        meta={"channels": {}, "default_timezone": "Europe/London"},
+        events=events,
+        webhook_url=None,
+        webhook_info=None,
+        webhook_message_id=None,
+    )
+
+
+def property_value(lines: list[str], name: str) -> str | None:
+    for line in lines:
+        if line.split(":", 1)[0].split(";", 1)[0] == name:
+            return line.split(":", 1)[1]
+
+    return None
+
+
+class RecurrenceTest(unittest.TestCase):
+    def test_whole_intervals_repeat(self):
+        event = make_event("Fortnightly", 14.0)
+        lines = event_lines(make_lane("lane", [event]), event, NOW)
+
+        self.assertEqual(property_value(lines, "RRULE"), "FREQ=WEEKLY;INTERVAL=2")
+        self.assertIsNone(property_value(lines, "RDATE"))
+
+    def test_fractional_intervals_are_listed(self):
+        # Every 3.5 days, so alternately at 20:00 and 08:00, across the UK's clocks going back on October 25th
+        event = make_event("Twice weekly", 3.5, not_after=datetime.date(2026, 11, 30))
+        lines = event_lines(make_lane("lane", [event]), event, datetime.datetime(2026, 11, 14, tzinfo=datetime.UTC))
+
+        self.assertIsNone(property_value(lines, "RRULE"))
+
+        # Up to the time given, rather than not_after
+        zone = ZoneInfo(event.timezone)
+        expected = [
+            format_local(when.astimezone(zone))
+            for when in event.occurrences_between(event.basis, datetime.datetime(2026, 11, 14, tzinfo=datetime.UTC))
+        ]
+        listed = [property_value(lines, "DTSTART"), *property_value(lines, "RDATE").split(",")]
+
+        self.assertEqual(listed, expected)
+        self.assertEqual(listed[:2], ["20260905T200000", "20260909T080000"])
+        self.assertEqual(listed[-2:], ["20261107T200000", "20261111T080000"])
+
+    def test_fractional_intervals_list_at_least_the_first(self):
+        event = make_event("Twice weekly", 3.5)
+        lines = event_lines(make_lane("lane", [event]), event, event.basis - datetime.timedelta(days=30))
+
+        self.assertEqual(property_value(lines, "DTSTART"), "20260905T200000")
+        self.assertIsNone(property_value(lines, "RRULE"))
+        self.assertIsNone(property_value(lines, "RDATE"))
+
+
+class GenerateIcalTest(unittest.TestCase):
+    def test_global_feed_has_every_lanes_events(self):
+        snapshot = ScheduleSnapshot.build([
+            make_lane("first", [make_event("Weekly", 7), make_event("Twice weekly", 3.5)]),
+            make_lane("second", [make_event("Daily", 1)]),
+        ], NOW)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output_writer = OutputWriter(pathlib.Path(directory))
+            names = generate_ical(snapshot, output_writer)
+
+            self.assertEqual(names, ["calendar/first.ics", "calendar/second.ics", GLOBAL_CALENDAR_FILENAME])
+
+            def events(name: str) -> list[str]:
+                content = (pathlib.Path(directory) / name).read_bytes().decode("utf-8")
+                return ["BEGIN:VEVENT" + part.split("END:VEVENT")[0] for part in content.split("BEGIN:VEVENT")[1:]]
+
+            self.assertEqual(len(events("calendar/first.ics")), 2)
+            self.assertEqual(events(GLOBAL_CALENDAR_FILENAME), events("calendar/first.ics") + events("calendar/second.ics"))
+
+
+if __name__ == "__main__":
+    unittest.main()
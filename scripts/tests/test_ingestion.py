@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the lane cache, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import pathlib
+import tempfile
+import threading
+import unittest
+
+import reporting
+from builder import load_schemas
+from ingestion import PARALLEL_THRESHOLD, CachedLane, IngestedLane, LaneCache, TemplateValidationError, ingest_lanes
+
+
+EVENT = """\
+  - host: Host {index}
+    name: "Class {index}"
+    tags:
+      - event:class
+    schedule:
+      basis: "2025-03-15"
+      day: Saturday
+      hour: {hour}
+      minute: 0
+"""
+
+
+class LaneCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.quiet, reporting.reporter.quiet = reporting.reporter.quiet, True
+        self.directory = tempfile.TemporaryDirectory()
+        self.lane_cache = LaneCache(pathlib.Path(self.directory.name))
+
+    def tearDown(self):
+        reporting.reporter.quiet = self.quiet
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        lane = CachedLane({"channels": {}}, [])
+        self.lane_cache.put("lane", "key", lane)
+        self.assertEqual(self.lane_cache.get("lane", "key"), lane)
+        self.assertIsNone(self.lane_cache.get("lane", "other"))
+
+    def test_unpicklable_lane_is_skipped(self):
+        # A lock can't be pickled, the build should carry on without a cache entry or a stray temporary file
+        self.lane_cache.put("lane", "key", CachedLane({"lock": threading.Lock()}, []))
+        self.assertIsNone(self.lane_cache.get("lane", "key"))
+        self.assertEqual(list(pathlib.Path(self.directory.name).iterdir()), [])
+
+
+class IngestLanesTest(unittest.TestCase):
+    def setUp(self):
+        self.quiet, reporting.reporter.quiet = reporting.reporter.quiet, True
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        reporting.reporter.quiet = self.quiet
+        self.directory.cleanup()
+
+    def write_lane(self, name: str, invalid_index: int | None = None) -> pathlib.Path:
+        lane_folder = pathlib.Path(self.directory.name) / name
+        lane_folder.mkdir()
+        (lane_folder / "meta.yaml").write_text('default_timezone: Europe/London\nchannels: {}\n')
+        (lane_folder / "events.yaml").write_text("events:\n" + "".join(
+            EVENT.format(index=index, hour=99 if index == invalid_index else 20) for index in range(2000)
+        ))
+        return lane_folder
+
+    def test_template_errors_come_back_from_the_pool(self):
+        lane_folders = [self.write_lane("valid"), self.write_lane("invalid", invalid_index=1500)]
+        # Enough to be parsed on the process pool
+        self.assertGreaterEqual(
+            sum(len((lane_folder / "events.yaml").read_bytes()) for lane_folder in lane_folders), PARALLEL_THRESHOLD,
+        )
+
+        meta_schema, events_schema = load_schemas()
+        lane_cache = LaneCache(pathlib.Path(self.directory.name) / "cache", enabled=False)
+        results = {
+            name: (lane, exception)
+            for name, lane, exception in ingest_lanes(lane_folders, meta_schema, events_schema, lane_cache, jobs=2)
+        }
+
+        lane, exception = results["valid"]
+        self.assertIsNone(exception)
+        self.assertIsInstance(lane, IngestedLane)
+        self.assertEqual(len(lane.events), 2000)
+
+        lane, exception = results["invalid"]
+        self.assertIsNone(lane)
+        self.assertIsInstance(exception, TemplateValidationError)
+        self.assertEqual(exception.event_lane_name, "invalid")
+        self.assertEqual(len(exception.errors), 1)
+        # The 1501st event's schedule, 9 lines per event after the `events:` line
+        self.assertIn("invalid/events.yaml:13507:", str(exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the occurrence index window, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import datetime
+import unittest
+from zoneinfo import ZoneInfo
+
+from definitions import EventLane, EventLaneEvent, ScheduleSnapshot
+from occurrences import OccurrenceIndex
+from transitions import TransitionTable
+
+
+def make_lane(name: str, timezone: str) -> EventLane:
+    return EventLane(
+        name=name,
+        meta={"channels": {}, "default_timezone": timezone},
+        events=[EventLaneEvent(
+            defined_line=1,
+            host="Host",
+            name="Event",
+            tags=(),
+            paused=False,
+            basis=datetime.datetime(2026, 1, 5, 20, 0, tzinfo=ZoneInfo(timezone)),
+            timezone=timezone,
+            interval=7,
+            duration=60,
+            not_before=None,
+            not_after=None,
+        )],
+        webhook_url=None,
+        webhook_info=None,
+        webhook_message_id=None,
+    )
+
+
+class OccurrenceIndexWindowTest(unittest.TestCase):
+    def test_covers_week_start_across_fall_back(self):
+        # The Monday the UK's clocks went back, after 04:00Z (the week start, 05:00 BST) but before 05:00Z (the next
+        #  one, 05:00 GMT), so the lane's week is more than 7 days old
+        now = datetime.datetime(2026, 10, 26, 4, 30, tzinfo=datetime.UTC)
+        event_lane = make_lane("sign_language_bsl", "Europe/London")
+        snapshot = ScheduleSnapshot.build([event_lane], now)
+
+        week_start = event_lane.week_start(now)
+        self.assertGreater(now - week_start, datetime.timedelta(days=7))
+
+        occurrence_index = OccurrenceIndex.build(snapshot)
+        occurrences = list(occurrence_index.between(week_start, week_start + datetime.timedelta(days=7)))
+        self.assertEqual(len(occurrences), 1)
+
+        transitions = TransitionTable.build(snapshot)
+        self.assertLessEqual(transitions.start, week_start - datetime.timedelta(days=7))
+
+
+if __name__ == "__main__":
+    unittest.main()
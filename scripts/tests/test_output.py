@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for writing outputs, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import os
+import pathlib
+import stat
+import tempfile
+import unittest
+
+from output import COMPRESSORS, FILE_MODE, HASH_MANIFEST_FILENAME, OutputWriter
+
+
+class OutputWriterModeTest(unittest.TestCase):
+    def test_outputs_get_the_default_file_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            folder = pathlib.Path(directory)
+            output_writer = OutputWriter(folder)
+
+            output_writer.write("old.json", "{}")
+
+            with output_writer.open("index.html") as stream:
+                stream.write("<html></html>")
+
+            output_writer.finish()
+
+            names = ["old.json", "old.json.gz", "index.html", "index.html.gz", HASH_MANIFEST_FILENAME]
+
+            for name in names:
+                with self.subTest(name=name):
+                    self.assertEqual(stat.S_IMODE(os.stat(folder / name).st_mode), FILE_MODE)
+
+
+class OutputWriterChangesTest(unittest.TestCase):
+    def test_only_changed_files_and_their_variants_are_listed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            folder = pathlib.Path(directory)
+
+            output_writer = OutputWriter(folder)
+            output_writer.write("old.json", "{}")
+            output_writer.write("webhook.json", "[]")
+            self.assertEqual(output_writer.finish(), ["old.json", *(f"old.json{suffix}" for suffix in COMPRESSORS), "webhook.json"])
+
+            # A later build over the same folder (e.g. CI's restored deploy output) only rewrites what changed
+            output_writer = OutputWriter(folder)
+            output_writer.write("old.json", "{}")
+
+            with output_writer.open("index.html") as stream:
+                stream.write("<html></html>")
+
+            output_writer.write("webhook.json", "[]")
+            self.assertEqual(output_writer.finish(), ["index.html", *(f"index.html{suffix}" for suffix in COMPRESSORS)])
+
+
+if __name__ == "__main__":
+    unittest.main()
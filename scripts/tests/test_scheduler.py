@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the resident scheduler, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import datetime
+import unittest
+from unittest import mock
+
+import click
+
+import scheduler
+
+
+class RunScheduledTest(unittest.TestCase):
+    def setUp(self):
+        # Each cycle swaps in a fresh reporter
+        self.reporter = scheduler.reporting.reporter
+
+    def tearDown(self):
+        scheduler.reporting.reporter = self.reporter
+
+    def test_keeps_scheduling_after_failed_builds(self):
+        results = [
+            ValueError("Invalid webhook URL given."),
+            click.ClickException("1 output format(s) failed to generate"),
+            None,
+        ]
+        wakes = []
+
+        def build(**_build_arguments):
+            result = results.pop(0)
+
+            if isinstance(result, Exception):
+                raise result
+
+            return result
+
+        def sleep_until(wake: datetime.datetime):
+            wakes.append(wake)
+
+            if not results:
+                raise KeyboardInterrupt
+
+        with (
+            mock.patch.object(scheduler, "build", build),
+            mock.patch.object(scheduler, "sleep_until", sleep_until),
+            mock.patch.object(scheduler.reporting, "warn"),
+            mock.patch.object(scheduler.reporting, "echo"),
+        ):
+            scheduler.run_scheduled(quiet=True)
+
+        # Both failures retry soon, then the successful build (with nothing due to change) sleeps for the longest
+        self.assertEqual(len(wakes), 3)
+        now = datetime.datetime.now(datetime.UTC)
+        self.assertLessEqual(wakes[0] - now, scheduler.RETRY_AFTER)
+        self.assertLessEqual(wakes[1] - now, scheduler.RETRY_AFTER)
+        self.assertGreater(wakes[2] - now, scheduler.RETRY_AFTER)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the resident server, run from scripts/ with `python -m unittest discover -s tests`
+"""
+
+import datetime
+import re
+import unittest
+
+from server import INDEX_FILENAME, ScheduleServer, accepts_gzip
+
+
+class AcceptsGzipTest(unittest.TestCase):
+    def test_q_values(self):
+        self.assertTrue(accepts_gzip("gzip, deflate, br"))
+        self.assertTrue(accepts_gzip("br;q=1.0, gzip;q=0.8"))
+        self.assertTrue(accepts_gzip("*"))
+        self.assertFalse(accepts_gzip(None))
+        self.assertFalse(accepts_gzip("identity"))
+        self.assertFalse(accepts_gzip("gzip;q=0"))
+        self.assertFalse(accepts_gzip("gzip;q=0.000, *;q=1"))
+        self.assertFalse(accepts_gzip("*;q=0"))
+
+
+class ServedLinksTest(unittest.TestCase):
+    def test_index_only_links_to_served_files(self):
+        schedule_server = ScheduleServer([])
+        period = datetime.datetime(2026, 10, 14, 15, 32, tzinfo=datetime.UTC)
+        body = schedule_server.render(INDEX_FILENAME, period).body.decode("utf-8")
+
+        # Leaving out the external links in the page's header
+        links = [link for link in re.findall(r'<a href="([^"]+)"', body) if "://" not in link]
+        self.assertIn("old.json", links)
+        self.assertNotIn("calendar/all.ics", links)
+        self.assertEqual(links, list(schedule_server.output_formats))
+
+
+if __name__ == "__main__":
+    unittest.main()
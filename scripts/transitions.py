@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tables of when time zones change their UTC offset (i.e. DST), for flagging events and days that clocks changing
+affects without converting every occurrence into every zone to look for it.
+"""
+
+import bisect
+import datetime
+import functools
+import typing
+from zoneinfo import ZoneInfo
+
+from definitions import EventLaneEvent, ScheduleSnapshot
+from formats.timezones import DISPLAY_TIMEZONES, DISPLAY_TIMEZONES_SPECIAL, TIMEZONE_PAIRS
+from occurrences import HORIZON, window_start
+
+
+# Every zone an output shows times in
+DISPLAY_ZONES: list[datetime.tzinfo] = list(dict.fromkeys([
+    *DISPLAY_TIMEZONES,
+    *(zone for zone, _alpha in DISPLAY_TIMEZONES_SPECIAL),
+    *(zone for _flag, zone in TIMEZONE_PAIRS),
+]))
+
+DAY = datetime.timedelta(days=1)
+SECOND = datetime.timedelta(seconds=1)
+
+
+class Transition(typing.NamedTuple):
+    when: datetime.datetime
+    before: datetime.timedelta
+    after: datetime.timedelta
+
+
+def offset_at(zone: datetime.tzinfo, when: datetime.datetime) -> datetime.timedelta:
+    return when.astimezone(zone).utcoffset()
+
+
+@functools.lru_cache(maxsize=1024)
+def find_transitions(zone: datetime.tzinfo, start: datetime.datetime, end: datetime.datetime) -> tuple[Transition, ...]:
+    """
+    Every change in `zone`'s UTC offset after `start` and up to a day past `end`.
+
+    The offset is checked daily and bisected down to the second where it changed, which relies on no zone changing
+    its offset twice within a day. Builds ask for whole days, so resident modes reuse the tables between builds.
+    """
+
+    transitions = []
+    previous, offset = start, offset_at(zone, start)
+
+    while previous < end:
+        current = previous + DAY
+        current_offset = offset_at(zone, current)
+
+        if current_offset != offset:
+            low, high = previous, current
+
+            # The offset changes at some second in (low, high]
+            while high - low > SECOND:
+                middle = low + (high - low) // 2 // SECOND * SECOND
+
+                if offset_at(zone, middle) == offset:
+                    low = middle
+                else:
+                    high = middle
+
+            transitions.append(Transition(high, offset, current_offset))
+            offset = current_offset
+
+        previous = current
+
+    return tuple(transitions)
+
+
+class TransitionTable:
+    """
+    The offset changes of a set of zones within [start, end), for looking up offsets (and what changed when) by
+    bisection. Lookups outside the window fall back to converting directly.
+    """
+
+    def __init__(self, zones: typing.Iterable[datetime.tzinfo], start: datetime.datetime, end: datetime.datetime):
+        self.start = start
+        self.end = end
+        self.initial_offsets: dict[datetime.tzinfo, datetime.timedelta] = {}
+        self.transitions: dict[datetime.tzinfo, tuple[Transition, ...]] = {}
+        self.instants: dict[datetime.tzinfo, list[datetime.datetime]] = {}
+
+        for zone in zones:
+            self.initial_offsets[zone] = offset_at(zone, start)
+            self.transitions[zone] = find_transitions(zone, start, end)
+            self.instants[zone] = [transition.when for transition in self.transitions[zone]]
+
+    @classmethod
+    def build(cls, snapshot: ScheduleSnapshot) -> "TransitionTable":
+        events = [event for event_lane in snapshot.event_lanes for event in event_lane.events]
+        zones = [
+            *DISPLAY_ZONES,
+            *(ZoneInfo(event_lane.meta["default_timezone"]) for event_lane in snapshot.event_lanes),
+            *(ZoneInfo(event.timezone) for event in events),
+        ]
+
+        # Far enough back to compare the earliest occurrence in the index with the one before it
+        longest_interval = datetime.timedelta(days=max((event.interval for event in events), default=7))
+        start = (window_start(snapshot) - longest_interval).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = (snapshot.now + HORIZON).replace(hour=0, minute=0, second=0, microsecond=0) + DAY
+
+        return cls(dict.fromkeys(zones), start, end)
+
+    def offset(self, zone: datetime.tzinfo, when: datetime.datetime) -> datetime.timedelta:
+        if zone not in self.transitions or not self.start <= when < self.end:
+            return offset_at(zone, when)
+
+        index = bisect.bisect_right(self.instants[zone], when)
+        return self.transitions[zone][index - 1].after if index else self.initial_offsets[zone]
+
+    def transitions_between(self, zone: datetime.tzinfo, start: datetime.datetime, end: datetime.datetime) -> list[Transition]:
+        """
+        The offset changes in `zone` within [start, end), which has to be within the table's window.
+        """
+
+        instants = self.instants.get(zone, [])
+        return list(self.transitions.get(zone, ())[bisect.bisect_left(instants, start):bisect.bisect_left(instants, end)])
+
+    def shifted_zones(
+        self,
+        event: EventLaneEvent,
+        when: datetime.datetime,
+        zones: typing.Iterable[datetime.tzinfo],
+    ) -> list[datetime.tzinfo]:
+        """
+        The zones in which the occurrence at `when` is at a different time of day than the event's previous
+        occurrence, because the event's zone and that zone changed their clocks at different times.
+        """
+
+        event_zone = ZoneInfo(event.timezone)
+        previous = when - datetime.timedelta(days=event.interval)
+        event_change = self.offset(event_zone, when) - self.offset(event_zone, previous)
+
+        return [zone for zone in zones if self.offset(zone, when) - self.offset(zone, previous) != event_change]
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""
+Resident watch mode, which rebuilds the local outputs as templates, schemas and page templates are edited.
+"""
+
+import os
+import pathlib
+import queue
+import typing
+
+import click
+
+import reporting
+from builder import OUTPUT_FOLDER, find_lane_folders, load_event_lanes, load_schemas, render_formats
+from definitions import EventLane
+from formats.all import OUTPUT_FORMATS, SHARED_INPUTS, OutputFormat
+from formats.html import TEMPLATES_DIRECTORY
+from ingestion import SCHEMA_FOLDER, TEMPLATES_FOLDER, LaneCache, TemplateSchemas
+from output import OutputWriter
+from pipeline import Pipeline
+from reporting import BuildReporter, Stopwatch
+
+
+# Watching is for previewing changes locally, so nothing is sent to Discord
+LOCAL_FORMATS = [output_format for output_format in OUTPUT_FORMATS if not output_format.publishes]
+
+WATCHED_FOLDERS = [TEMPLATES_FOLDER, SCHEMA_FOLDER, TEMPLATES_DIRECTORY]
+WATCHED_EVENT_TYPES = {"created", "deleted", "modified", "moved"}
+LANE_FILES = {"meta.yaml", "events.yaml"}
+
+# Editors often save in several steps (e.g. write a temporary file, then rename it over the original), so changes
+#  are collected until nothing has happened for this long
+DEBOUNCE_SECONDS = 0.05
+
+
+class Changes(typing.NamedTuple):
+    lanes: set[str]
+    schemas: bool
+    templates: set[str]
+
+
+def classify_changes(paths: set[pathlib.Path]) -> Changes:
+    lanes: set[str] = set()
+    schemas = False
+    templates: set[str] = set()
+
+    for path in paths:
+        if path.is_relative_to(SCHEMA_FOLDER):
+            schemas = schemas or path.suffix == ".json"
+        elif path.is_relative_to(TEMPLATES_FOLDER):
+            parts = path.relative_to(TEMPLATES_FOLDER).parts
+
+            # Either the lane folder itself (added, removed or renamed) or one of its templates
+            if len(parts) == 1 or (len(parts) == 2 and parts[1] in LANE_FILES):
+                lanes.add(parts[0])
+        elif path.is_relative_to(TEMPLATES_DIRECTORY) and path.suffix == ".jinja2":
+            templates.add(path.name)
+
+    return Changes(lanes, schemas, templates)
+
+
+class ChangeCollector:
+    """
+    Receives filesystem events from watchdog's observer thread and hands the changed paths to the main thread.
+    """
+
+    def __init__(self):
+        self.paths: queue.Queue[pathlib.Path] = queue.Queue()
+
+    def dispatch(self, event):
+        if event.event_type not in WATCHED_EVENT_TYPES:
+            return
+
+        self.paths.put(pathlib.Path(os.fsdecode(event.src_path)))
+
+        if getattr(event, "dest_path", ""):
+            self.paths.put(pathlib.Path(os.fsdecode(event.dest_path)))
+
+    def wait(self) -> set[pathlib.Path]:
+        paths = {self.paths.get()}
+
+        while True:
+            try:
+                paths.add(self.paths.get(timeout=DEBOUNCE_SECONDS))
+            except queue.Empty:
+                return paths
+
+
+class WatchedBuild:
+    """
+    Keeps the schemas and converted lanes in memory between rebuilds, so only what changed is ingested again.
+    """
+
+    def __init__(
+        self,
+        no_cache: bool = False,
+        quiet: bool = False,
+        output_formats: list[OutputFormat] = LOCAL_FORMATS,
+        lane_names: set[str] | None = None,
+    ):
+        self.no_cache = no_cache
+        self.quiet = quiet
+        self.output_formats = [output_format for output_format in output_formats if not output_format.publishes]
+        self.lane_names = lane_names
+        self.event_lanes: dict[str, EventLane] = {}
+        self.load_schemas()
+
+    def load_schemas(self):
+        self.meta_schema, self.events_schema = load_schemas()
+        self.template_schemas = TemplateSchemas(self.meta_schema, self.events_schema)
+        # The cache key covers the schemas, so it has to be worked out again
+        self.lane_cache = LaneCache(enabled=not self.no_cache)
+
+    def reload_lanes(self, names: set[str] | None = None):
+        """
+        Ingests the named lanes again (or every lane), dropping any that no longer exist. A lane that fails to load
+        keeps its last good version.
+        """
+
+        lane_folders = [
+            lane_folder for lane_folder in find_lane_folders()
+            if self.lane_names is None or lane_folder.name in self.lane_names
+        ]
+        present = {lane_folder.name for lane_folder in lane_folders}
+
+        for event_lane_name in (set(self.event_lanes) if names is None else names) - present:
+            if self.event_lanes.pop(event_lane_name, None) is not None:
+                reporting.echo(f"  Removed event lane `{event_lane_name}`")
+
+        for lane_folder in lane_folders:
+            if names is not None and lane_folder.name not in names:
+                continue
+
+            try:
+                [event_lane] = load_event_lanes(
+                    [lane_folder], self.meta_schema, self.events_schema, self.lane_cache,
+                    jobs=1, template_schemas=self.template_schemas, resolve_webhooks=False,
+                )
+            except click.ClickException as exception:
+                kept = " (keeping its last good version)" if lane_folder.name in self.event_lanes else ""
+                reporting.warn(f"{exception.message}{kept}")
+            else:
+                self.event_lanes[event_lane.name] = event_lane
+
+    def render(self, output_formats: list[OutputFormat]):
+        # Same order as a full build
+        event_lanes = [
+            self.event_lanes[lane_folder.name] for lane_folder in find_lane_folders()
+            if lane_folder.name in self.event_lanes
+        ]
+
+        # Precompressing is slow and only matters once deployed, the next full build catches the variants up
+        output_writer = OutputWriter(OUTPUT_FOLDER, precompressed_patterns=[])
+        pipeline = Pipeline({"event_lanes": event_lanes, "output_writer": output_writer}, SHARED_INPUTS)
+        render_formats(pipeline, output_formats, output_writer)
+        output_writer.finish()
+
+    def rebuild(self, changes: Changes | None = None):
+        """
+        Rebuilds whatever depends on `changes`, or everything if not given.
+        """
+
+        reporting.reporter = BuildReporter(quiet=self.quiet)
+        stopwatch = Stopwatch()
+        output_formats: list[OutputFormat] = []
+
+        if changes is None:
+            reporting.echo("Reading event lane templates...", fg='blue')
+            self.reload_lanes()
+            output_formats = self.output_formats
+        elif changes.schemas:
+            reporting.echo("Schemas changed, reloading every lane...", fg='blue')
+
+            try:
+                self.load_schemas()
+            except Exception as exception:
+                reporting.warn(f"Could not load the schemas ({exception}), keeping the previous ones")
+                return
+
+            self.reload_lanes()
+            output_formats = self.output_formats
+        elif changes.lanes:
+            if self.lane_names is not None:
+                changes = changes._replace(lanes=changes.lanes & self.lane_names)
+
+                if not changes.lanes:
+                    return
+
+            reporting.echo(f"Event lane(s) changed: {', '.join(sorted(changes.lanes))}", fg='blue')
+            self.reload_lanes(changes.lanes)
+            output_formats = self.output_formats
+        elif changes.templates:
+            # A template no format lists (e.g. a new include) could be used by any of them
+            known_templates = {template for output_format in OUTPUT_FORMATS for template in output_format.templates}
+            output_formats = [
+                output_format for output_format in self.output_formats
+                if output_format.templates
+                and (changes.templates & set(output_format.templates) or changes.templates - known_templates)
+            ]
+
+        if not output_formats:
+            return
+
+        reporting.echo("Generating output formats...", fg='blue')
+        self.render(output_formats)
+        reporting.echo(f"Rebuilt {len(output_formats)} output(s) in {stopwatch.elapsed().wall * 1000:.0f} ms", fg='blue')
+
+
+def watch(
+    no_cache: bool = False,
+    quiet: bool = False,
+    output_formats: list[OutputFormat] = LOCAL_FORMATS,
+    lane_names: set[str] | None = None,
+):
+    """
+    Builds the local outputs, then rebuilds them on every change until interrupted.
+
+    Changes to the Python scripts themselves aren't picked up, restart to use them.
+    """
+
+    try:
+        from watchdog.observers import Observer
+    except ImportError:
+        raise click.ClickException("Watching needs the watchdog package (pip install watchdog)")
+
+    collector = ChangeCollector()
+    observer = Observer()
+
+    for folder in WATCHED_FOLDERS:
+        observer.schedule(collector, str(folder), recursive=True)
+
+    # Started before the first build so nothing saved during it is missed
+    observer.start()
+
+    try:
+        watched_build = WatchedBuild(no_cache, quiet, output_formats, lane_names)
+        watched_build.rebuild()
+
+        reporting.echo("Watching for changes, press Ctrl+C to stop", fg='blue')
+
+        while True:
+            watched_build.rebuild(classify_changes(collector.wait()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for Discord's webhook API, for testing and benchmarking the webhook publisher offline.
+
+Run it and point the build at it:
+
+    python scripts/webhook_stub.py --port 8787
+    python scripts/build_manifests.py --webhook-base-url http://127.0.0.1:8787
+"""
+
+import asyncio
+import contextlib
+import dataclasses
+import itertools
+import socket
+import threading
+import typing
+
+import click
+from aiohttp import web
+
+
+@dataclasses.dataclass
+class StubStats:
+    requests: int = 0
+    rate_limited: int = 0
+    sent: int = 0
+    edited: int = 0
+
+
+def create_stub_app(latency: float = 0.0, rate_limit_every: int = 0, retry_after: float = 0.05) -> web.Application:
+    """
+    Builds the stand-in app.
+
+    `latency` is added to every response, and if `rate_limit_every` is set, every Nth request is answered with a
+    429 like Discord would.
+    """
+
+    stats = StubStats()
+    message_ids = itertools.count(1_200_000_000_000_000_000)
+
+    async def respond(request: web.Request, message_id: int) -> web.Response:
+        stats.requests += 1
+
+        if latency:
+            await asyncio.sleep(latency)
+
+        if rate_limit_every and stats.requests % rate_limit_every == 0:
+            stats.rate_limited += 1
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+                status=429,
+                headers={"Retry-After": str(retry_after), "X-RateLimit-Remaining": "0"},
+            )
+
+        payload = await request.json()
+
+        return web.json_response(
+            {"id": str(message_id), "embeds": payload.get("embeds", [])},
+            headers={"X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "1.0"},
+        )
+
+    async def send(request: web.Request) -> web.Response:
+        stats.sent += 1
+        return await respond(request, next(message_ids))
+
+    async def edit(request: web.Request) -> web.Response:
+        stats.edited += 1
+        return await respond(request, int(request.match_info["message_id"]))
+
+    app = web.Application()
+    app["stats"] = stats
+    app.add_routes([
+        web.post("/api/webhooks/{webhook_id}/{token}", send),
+        web.patch("/api/webhooks/{webhook_id}/{token}/messages/{message_id}", edit),
+    ])
+
+    return app
+
+
+@contextlib.contextmanager
+def running_stub(**kwargs) -> typing.Iterator[tuple[str, StubStats]]:
+    """
+    Runs the stand-in on a free local port in a background thread, yielding its base URL and stats.
+    """
+
+    app = create_stub_app(**kwargs)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{port}", app["stats"]
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=8787, type=int)
+@click.option("--latency", default=0.0, type=float, help="Seconds to wait before answering each request.")
+@click.option("--rate-limit-every", default=0, type=int, help="Answer every Nth request with a 429.")
+def main(host: str, port: int, latency: float, rate_limit_every: int):
+    web.run_app(create_stub_app(latency=latency, rate_limit_every=rate_limit_every), host=host, port=port)
+
+
+if __name__ == '__main__':
+    main()